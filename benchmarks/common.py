@@ -0,0 +1,86 @@
+import os
+import sys
+import json
+import time
+import platform
+import datetime
+import subprocess
+import statistics
+from typing import List, Dict, Any, Callable
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+SRC_DIR = os.path.join(REPO_DIR, "src", "python")
+
+def use_data_dir(data_dir: str):
+    """
+    让被测代码使用指定的数据目录。必须在导入 config 之前调用，
+    因为 config 在导入时读取 AGENT_DATA_DIR。
+    """
+    os.environ["AGENT_DATA_DIR"] = os.path.abspath(data_dir)
+    if SRC_DIR not in sys.path:
+        sys.path.insert(0, SRC_DIR)
+
+def measure(func: Callable[[], Any], repeat: int, warmup: int = 1) -> Dict[str, float]:
+    """多次调用 func 并统计耗时（秒）"""
+    for _ in range(warmup):
+        func()
+    durations: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+    return {
+        "repeat": repeat,
+        "mean_s": statistics.fmean(durations),
+        "min_s": durations[0],
+        "p50_s": durations[len(durations) // 2],
+        "p95_s": durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+        "max_s": durations[-1],
+    }
+
+def run_metadata() -> Dict[str, Any]:
+    """记录本次运行的环境，便于在不同版本之间比较结果"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def write_results(filepath: str, suite: str, results: List[Dict[str, Any]]):
+    """把结果写成 JSON 文件：{"suite", "meta", "results": [...]}"""
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump({"suite": suite, "meta": run_metadata(), "results": results}, f, ensure_ascii=False, indent=4)
+    print(f"Results written to {filepath}", file=sys.stderr)
+
+def compare_results(current: List[Dict[str, Any]], baseline_file: str, threshold: float) -> bool:
+    """
+    与之前保存的结果比较 mean_s。任何一项变慢超过 threshold 倍时返回 False。
+    """
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = {(r["benchmark"], r.get("size")): r for r in json.load(f)["results"]}
+
+    ok = True
+    for result in current:
+        previous = baseline.get((result["benchmark"], result.get("size")))
+        if previous is None or previous["mean_s"] == 0:
+            continue
+        ratio = result["mean_s"] / previous["mean_s"]
+        flag = ""
+        if ratio > threshold:
+            flag = "  <-- REGRESSION"
+            ok = False
+        print(f"{result['benchmark']:<40} size={str(result.get('size')):>10}  {ratio:6.2f}x{flag}")
+    return ok
+
+def print_result(result: Dict[str, Any]):
+    print(f"{result['benchmark']:<40} size={str(result.get('size')):>10}  "
+          f"mean={result['mean_s'] * 1000:10.3f} ms  p95={result['p95_s'] * 1000:10.3f} ms", flush=True)
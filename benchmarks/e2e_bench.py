@@ -0,0 +1,88 @@
+"""
+ranker.py 的端到端基准测试。
+
+启动本地的 OpenAI 兼容桩服务（可配置延迟），在生成的数据上多次运行 ranker.py，
+记录从启动进程到进程退出的总耗时。每次运行前清空推荐词缓存，除非指定 --keep-cache。
+
+用法：
+    python e2e_bench.py --size 1000 --latency 0.2 --runs 5 --output e2e.json [--compare old.json]
+    python e2e_bench.py --ranker-args=--no-llm --runs 20 --output startup.json   # 只排序，跟踪冷启动耗时
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+from typing import List, Dict, Any
+
+import common
+import generate_data
+import stub_llm_server
+
+def run_ranker(data_dir: str, names: str, port: int, extra_args: List[str]) -> float:
+    env = dict(os.environ)
+    env.update({
+        "AGENT_DATA_DIR": data_dir,
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{port}/v1",
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_MODEL": "stub",
+    })
+    start = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(common.SRC_DIR, "ranker.py"), names, *extra_args],
+                   input="q\n", text=True, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end ranker.py benchmark against a stub LLM.")
+    parser.add_argument("--size", type=int, default=1000, help="number of restaurants in the generated catalog")
+    parser.add_argument("--candidates", type=int, default=20, help="number of names passed to ranker.py")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.2, help="stub LLM latency per request in seconds")
+    parser.add_argument("--token-delay", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--keep-cache", action="store_true", help="keep the recommendation cache between runs")
+    parser.add_argument("--ranker-args", default="", help="extra arguments passed to ranker.py")
+    parser.add_argument("--work-dir", default=None)
+    parser.add_argument("--output", default="e2e.json")
+    parser.add_argument("--compare", default=None)
+    parser.add_argument("--threshold", type=float, default=1.2)
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="agent-e2e-")
+    data_dir = os.path.join(work_dir, f"size_{args.size}")
+    if not os.path.exists(os.path.join(data_dir, "restaurants_info.json")):
+        generate_data.generate_data_dir(data_dir, args.size, args.size)
+    names = ",".join(generate_data.restaurant_name(i) for i in range(min(args.candidates, args.size)))
+    cache_file = os.path.join(data_dir, "recommendation_cache.json")
+
+    server = stub_llm_server.start_server(args.port, args.latency, args.token_delay)
+    durations = []
+    try:
+        for _ in range(args.runs):
+            if not args.keep_cache and os.path.exists(cache_file):
+                os.remove(cache_file)
+            durations.append(run_ranker(data_dir, names, args.port, args.ranker_args.split()))
+    finally:
+        server.shutdown()
+
+    durations.sort()
+    result: Dict[str, Any] = {
+        "benchmark": f"ranker.py e2e (latency={args.latency}s{', cached' if args.keep_cache else ''}"
+                     f"{', ' + args.ranker_args if args.ranker_args else ''})",
+        "size": args.size,
+        "repeat": args.runs,
+        "mean_s": sum(durations) / len(durations),
+        "min_s": durations[0],
+        "p50_s": durations[len(durations) // 2],
+        "p95_s": durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+        "max_s": durations[-1],
+    }
+    common.print_result(result)
+    common.write_results(args.output, "e2e", [result])
+    if args.compare and not common.compare_results([result], args.compare, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+生成基准测试用的合成数据：restaurants_info.json、history.jsonl 与 user_profile.json。
+
+数据按行流式写出，生成 10M 行的目录也不需要把所有记录放进内存。
+
+用法：
+    python generate_data.py OUTPUT_DIR --restaurants 100000 --history 10000 [--seed 0]
+"""
+import os
+import json
+import random
+import argparse
+import datetime
+
+ATTRIBUTE_KEYS = ["sweetness", "spiciness", "price", "distance", "rating"]
+
+DISHES = ["饺子", "红烧肉", "麻辣烫", "炸酱面", "披萨", "牛排", "通心粉", "海鲜", "凉拌菜", "肉包", "素食", "火锅"]
+STYLES = ["正宗四川风味", "地道北京风味", "浪漫的意大利风味", "清淡的广式风味", "健康的轻食风格", "香辣的湘菜风格"]
+
+def restaurant_name(index: int) -> str:
+    return f"{DISHES[index % len(DISHES)]}店{index:08d}"
+
+def generate_restaurants(filepath: str, count: int, rng: random.Random):
+    """流式写出 JSON 数组格式的餐厅目录"""
+    with open(filepath, 'w', encoding='utf-8') as f:
+        f.write("[\n")
+        for index in range(count):
+            dish = DISHES[index % len(DISHES)]
+            record = {
+                "name": restaurant_name(index),
+                "description": f"{rng.choice(STYLES)}，招牌菜是{dish}和{rng.choice(DISHES)}。",
+                "attributes": {key: round(rng.random(), 2) for key in ATTRIBUTE_KEYS},
+            }
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write(",\n" if index < count - 1 else "\n")
+        f.write("]\n")
+
+def generate_history(filepath: str, count: int, restaurant_count: int, rng: random.Random, days: int = 365):
+    """写出 JSON Lines 格式的订单历史，日期在最近 days 天内均匀分布"""
+    today = datetime.date.today()
+    with open(filepath, 'w', encoding='utf-8') as f:
+        for _ in range(count):
+            record = {
+                "restaurant_name": restaurant_name(rng.randrange(restaurant_count)),
+                "order_date": (today - datetime.timedelta(days=rng.randrange(days))).isoformat(),
+            }
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def generate_data_dir(output_dir: str, restaurant_count: int, history_count: int, seed: int = 0):
+    """在 output_dir 中生成一套完整的数据文件"""
+    os.makedirs(output_dir, exist_ok=True)
+    rng = random.Random(seed)
+    generate_restaurants(os.path.join(output_dir, "restaurants_info.json"), restaurant_count, rng)
+    generate_history(os.path.join(output_dir, "history.jsonl"), history_count, restaurant_count, rng)
+    with open(os.path.join(output_dir, "user_profile.json"), 'w', encoding='utf-8') as f:
+        json.dump({key: round(rng.random(), 2) for key in ATTRIBUTE_KEYS}, f, indent=4)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic catalog and history data.")
+    parser.add_argument("output_dir")
+    parser.add_argument("--restaurants", type=int, default=1000)
+    parser.add_argument("--history", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_data_dir(args.output_dir, args.restaurants, args.history, args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+核心函数的微基准测试。
+
+每个数据规模在独立的子进程中运行（config 在导入时确定数据目录），结果写入一个 JSON 文件，
+可以用 --compare 与之前的结果比较以发现性能回退。
+
+用法：
+    python microbench.py --sizes 10,1000,100000 --output microbench.json [--compare old.json]
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+import subprocess
+from typing import List, Dict, Any
+
+import common
+import generate_data
+
+def run_size(size: int, data_dir: str, repeat: int) -> List[Dict[str, Any]]:
+    """在当前进程中对一个数据规模运行所有微基准（需先调用 common.use_data_dir）"""
+    import asyncio
+    import helper
+    import config
+    import order_helper
+
+    restaurants = helper.load_json_data(config.RESTAURANTS_FILE)
+    names = [restaurant["name"] for restaurant in restaurants]
+    profile = helper.load_json_data(config.USER_PROFILE_FILE)
+    rng = random.Random(0)
+    sample_names = [rng.choice(names) for _ in range(100)]
+    vectors = [[rng.random() for _ in range(5)] for _ in range(1000)]
+    loop = asyncio.new_event_loop()
+
+    def rank_cold():
+        helper._ranking_engine_cache = (None, None)
+        helper.perform_ranking(names, restaurants, profile)
+
+    def cosine_batch():
+        for vector in vectors:
+            helper.cosine_similarity(vector, vectors[0])
+
+    def tool_batch(tool, argument):
+        async def run():
+            for name in sample_names:
+                await tool(**{argument: name})
+        return lambda: loop.run_until_complete(run())
+
+    def batch_tool(tool, argument):
+        return lambda: loop.run_until_complete(tool(**{argument: sample_names}))
+
+    heavy_repeat = max(1, min(repeat, 100000 // max(size, 1)))
+    benchmarks = [
+        ("load_json_data(restaurants)", lambda: helper.load_json_data(config.RESTAURANTS_FILE), heavy_repeat),
+        ("cosine_similarity x1000", cosine_batch, repeat),
+        ("perform_ranking(all names, cold)", rank_cold, heavy_repeat),
+        ("perform_ranking(all names, warm)", lambda: helper.perform_ranking(names, restaurants, profile), heavy_repeat),
+        ("perform_ranking(all names, top10)", lambda: helper.perform_ranking(names, restaurants, profile, top_k=10), heavy_repeat),
+        ("update_user_profile_from_history", lambda: helper.update_user_profile_from_history(restaurants), heavy_repeat),
+        ("db_search x100", tool_batch(order_helper.db_search, "query"), repeat),
+        ("similarity_calc x100", tool_batch(order_helper.similarity_calc, "restaurant_name"), repeat),
+        ("db_search_batch(100 names)", batch_tool(order_helper.db_search_batch, "queries"), repeat),
+        ("similarity_calc_batch(100 names)", batch_tool(order_helper.similarity_calc_batch, "restaurant_names"), repeat),
+    ]
+
+    results = []
+    for name, func, times in benchmarks:
+        result = {"benchmark": name, "size": size, **common.measure(func, times)}
+        common.print_result(result)
+        results.append(result)
+    loop.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Run microbenchmarks over synthetic data.")
+    parser.add_argument("--sizes", default="10,1000,100000", help="comma separated catalog/history sizes (up to 10000000)")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--work-dir", default=None, help="directory for generated data (default: a temp dir)")
+    parser.add_argument("--output", default="microbench.json")
+    parser.add_argument("--compare", default=None, help="previous results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio reported as a regression")
+    parser.add_argument("--run-size", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--data-dir", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--child-output", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_size is not None:
+        # 子进程：只运行一个规模，把结果交给父进程
+        common.use_data_dir(args.data_dir)
+        results = run_size(args.run_size, args.data_dir, args.repeat)
+        with open(args.child_output, 'w', encoding='utf-8') as f:
+            json.dump(results, f)
+        return
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="agent-bench-")
+    all_results: List[Dict[str, Any]] = []
+    for size in (int(value) for value in args.sizes.split(',')):
+        data_dir = os.path.join(work_dir, f"size_{size}")
+        if not os.path.exists(os.path.join(data_dir, "restaurants_info.json")):
+            print(f"Generating {size} restaurants / history records in {data_dir} ...", file=sys.stderr)
+            generate_data.generate_data_dir(data_dir, size, size)
+        child_output = os.path.join(work_dir, f"results_{size}.json")
+        # 被测函数会向 stderr 输出大量提示信息，写入日志文件以免干扰结果
+        with open(os.path.join(work_dir, f"log_{size}.txt"), 'w') as log_file:
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--run-size", str(size), "--data-dir", data_dir,
+                            "--repeat", str(args.repeat), "--child-output", child_output],
+                           check=True, stderr=log_file)
+        with open(child_output, 'r', encoding='utf-8') as f:
+            all_results.extend(json.load(f))
+
+    common.write_results(args.output, "microbench", all_results)
+    if args.compare and not common.compare_results(all_results, args.compare, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+本地的 OpenAI 兼容 LLM 桩服务，用于端到端基准测试。
+
+只实现 POST /v1/chat/completions：
+  - 请求带 tools、消息中还没有工具结果、用户消息中也没有预取的调用结果时，
+    返回对 db_search 和 similarity_calc 的两个工具调用；
+  - 否则返回一段固定格式的推荐词（用户消息中附带了预取结果时直接使用这些结果）。
+支持 stream=True（SSE 分块输出）。--latency 控制首个响应前的延迟，--token-delay 控制流式输出时每个片段的间隔。
+
+用法：
+    python stub_llm_server.py --port 18080 --latency 0.2 --token-delay 0.01
+"""
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List
+
+PREFETCH_MARKER = " 的调用结果]"
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    token_delay = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        time.sleep(self.latency)
+
+        finish_reason, message = self.build_reply(body)
+        if body.get("stream"):
+            self.send_stream(finish_reason, message)
+        else:
+            self.send_json({
+                "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": body.get("model") or "stub",
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            })
+
+    @staticmethod
+    def build_reply(body: Dict[str, Any]):
+        messages = body.get("messages", [])
+        user_content = next((m.get("content") for m in messages if m.get("role") == "user"), "")
+        # 预取模式下用户消息为餐厅名字，后面附带 "[工具名(餐厅名字) 的调用结果]" 段落
+        restaurant_name, _, prefetched = user_content.partition("\n")
+        if PREFETCH_MARKER in prefetched:
+            return "stop", {"role": "assistant", "content": f"推荐{restaurant_name}：{prefetched}"}
+        if body.get("tools") and not any(m.get("role") == "tool" for m in messages):
+            return "tool_calls", {
+                "role": "assistant", "content": None,
+                "tool_calls": [
+                    {"id": "call_0", "type": "function",
+                     "function": {"name": "db_search", "arguments": json.dumps({"query": restaurant_name}, ensure_ascii=False)}},
+                    {"id": "call_1", "type": "function",
+                     "function": {"name": "similarity_calc", "arguments": json.dumps({"restaurant_name": restaurant_name}, ensure_ascii=False)}},
+                ],
+            }
+        tool_results = [str(m.get("content")) for m in messages if m.get("role") == "tool"]
+        return "stop", {"role": "assistant", "content": f"推荐{restaurant_name}：" + "；".join(tool_results)}
+
+    def send_json(self, payload: Dict[str, Any]):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_stream(self, finish_reason: str, message: Dict[str, Any]):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_chunk(data: bytes):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def send_delta(delta: Dict[str, Any], reason=None):
+            chunk = {"id": "stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": "stub",
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": reason}]}
+            send_chunk(("data: " + json.dumps(chunk, ensure_ascii=False) + "\n\n").encode("utf-8"))
+
+        deltas: List[Dict[str, Any]] = []
+        if finish_reason == "tool_calls":
+            for index, tool_call in enumerate(message["tool_calls"]):
+                deltas.append({"tool_calls": [{"index": index, "id": tool_call["id"], "type": "function",
+                                               "function": {"name": tool_call["function"]["name"], "arguments": ""}}]})
+                deltas.append({"tool_calls": [{"index": index, "function": {"arguments": tool_call["function"]["arguments"]}}]})
+        else:
+            content = message["content"]
+            deltas = [{"content": content[i:i + 4]} for i in range(0, len(content), 4)]
+
+        for delta in deltas:
+            send_delta(delta)
+            time.sleep(self.token_delay)
+        send_delta({}, finish_reason)
+        send_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+def start_server(port: int, latency: float = 0.0, token_delay: float = 0.0) -> ThreadingHTTPServer:
+    """在后台线程中启动桩服务，返回服务器对象（调用 shutdown() 停止）"""
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"latency": latency, "token_delay": token_delay})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub LLM server.")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before answering each request")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed chunks")
+    args = parser.parse_args()
+
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"latency": args.latency, "token_delay": args.token_delay})
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), handler)
+    print(f"Stub LLM server listening on http://127.0.0.1:{args.port}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
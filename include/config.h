@@ -11,6 +11,8 @@ namespace config {
     const std::string BIG_MODEL_PATH = "/mnt/d/temps/qwen2.5-3b-instruct-q4_k_m.gguf";
     const std::string PYTHON3_PATH = "/home/sy/agent/.venv/bin/python3";
     const std::string RANKER_SCRIPT_PATH = "/home/sy/agent/src/python/ranker.py";
+    // 常驻排序服务 (python src/python/service.py) 的 Unix 套接字，与 Python 端 config.SERVICE_SOCKET_PATH 一致
+    const std::string SERVICE_SOCKET_PATH = "/home/sy/agent/data/agent.sock";
     const std::string ICON_FILE_PATH = "/home/sy/agent/data/icon.txt";
 }
 
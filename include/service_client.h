@@ -0,0 +1,32 @@
+#ifndef SERVICE_CLIENT
+#define SERVICE_CLIENT
+
+#include <string>
+#include <stdexcept>
+
+class ServiceError : public std::runtime_error {
+public:
+    ServiceError(const std::string& message) : std::runtime_error(message) {}
+};
+
+// 常驻排序服务 (src/python/service.py) 的 Unix 套接字客户端，每行一个 JSON 请求/响应
+class ServiceClient {
+public:
+    explicit ServiceClient(const std::string& socket_path);
+    ~ServiceClient();
+    std::string request(const std::string& json_line);
+
+    static std::string escapeJson(const std::string& value);
+    static std::string getString(const std::string& json, const std::string& key);
+    static long getInt(const std::string& json, const std::string& key, long default_value);
+    static bool getBool(const std::string& json, const std::string& key);
+
+private:
+    int fd_;
+    std::string buffer_;
+    static size_t findValue(const std::string& json, const std::string& key);
+    ServiceClient(const ServiceClient&) = delete;
+    ServiceClient& operator=(const ServiceClient&) = delete;
+};
+
+#endif
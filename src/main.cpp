@@ -1,6 +1,7 @@
 #include "config.h"
 #include "llm_interface.h"
 #include "db_interface.h"
+#include "service_client.h"
 #include <iostream>
 #include <string>
 #include <vector>
@@ -8,6 +9,56 @@
 #include <cstdlib>
 #include <sstream>
 #include <fstream>
+#include <memory>
+
+// 通过常驻服务排序、生成推荐词并下单。服务没有运行时返回 false，由调用方退回到启动 ranker.py
+static bool rankWithService(const std::string& comma_separated_names) {
+    std::unique_ptr<ServiceClient> client;
+    try {
+        client.reset(new ServiceClient(config::SERVICE_SOCKET_PATH));
+    } catch (const ServiceError& e) {
+        std::cerr << "Ranking service not available (" << e.what() << "), starting ranker.py instead." << std::endl;
+        return false;
+    }
+
+    std::string response = client->request(
+        "{\"type\": \"rank\", \"names\": \"" + ServiceClient::escapeJson(comma_separated_names) + "\"}");
+    if (!ServiceClient::getBool(response, "ok")) {
+        throw ServiceError("Ranking request failed: " + ServiceClient::getString(response, "error"));
+    }
+    std::cout << ServiceClient::getString(response, "text") << std::endl;
+
+    long count = ServiceClient::getInt(response, "count", 0);
+    if (count <= 0) {
+        return true;
+    }
+
+    // 交互式选择，与 ranker.py 的提示一致
+    while (true) {
+        std::cout << "Please select a restaurant by number (1-" << count << "), or type 'q' to quit: ";
+        std::string choice_str;
+        if (!std::getline(std::cin, choice_str) || choice_str == "q" || choice_str == "Q") {
+            std::cout << "Order cancelled." << std::endl;
+            return true;
+        }
+        char* end = nullptr;
+        long choice = std::strtol(choice_str.c_str(), &end, 10);
+        if (choice_str.empty() || *end != '\0') {
+            std::cout << "Invalid input. Please enter a number or 'q'." << std::endl;
+            continue;
+        }
+        if (choice < 1 || choice > count) {
+            std::cout << "Invalid number. Please enter a number within the range." << std::endl;
+            continue;
+        }
+        response = client->request("{\"type\": \"order\", \"choice\": " + std::to_string(choice) + "}");
+        if (!ServiceClient::getBool(response, "ok")) {
+            throw ServiceError("Order request failed: " + ServiceClient::getString(response, "error"));
+        }
+        std::cout << "\n" << ServiceClient::getString(response, "message") << std::endl;
+        return true;
+    }
+}
 
 int main(int argc, char* argv[]) {
     if (argc < 2) {
@@ -67,6 +118,16 @@ int main(int argc, char* argv[]) {
         }
         std::string comma_separated_string = comma_separated_ss.str();
 
+        try {
+            if (rankWithService(comma_separated_string)) {
+                std::cout << "\nGoodbye!" << std::endl;
+                return 0;
+            }
+        } catch (const ServiceError& e) {
+            std::cerr << "Error talking to the ranking service: " << e.what() << std::endl;
+            return 1;
+        }
+
         std::string ranker_command = config::PYTHON3_PATH;
         ranker_command += " ";
         ranker_command += config::RANKER_SCRIPT_PATH;
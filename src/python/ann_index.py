@@ -0,0 +1,184 @@
+"""
+全目录 top-k 推荐使用的近似最近邻索引。
+
+索引对归一化后的 5 维属性向量做球面 k-means 粗量化：每个餐厅被分到与其夹角最小的聚类中心，
+同一聚类的行号连续存放（倒排表）。查询时先用偏好向量给所有聚类中心打分，
+只扫描得分最高的若干个聚类，再用 RankingEngine 的精确公式对这些候选重新打分，
+扫描的行数约为 N * probe / lists，远小于全表扫描。
+
+用法：
+    python ann_index.py build [--lists N]                      # 重建索引
+    python ann_index.py recall [--queries Q] [--top-k K] [--probe P]  # 与精确排序比较召回率
+"""
+import sys
+import argparse
+from typing import List, Dict, Any, Tuple, Optional
+
+import numpy as np
+
+import config
+import catalog
+import index_store
+from ranking_engine import RankingEngine, ATTRIBUTE_KEYS
+
+class AnnIndex:
+    def __init__(self, centroids: np.ndarray, list_offsets: np.ndarray, list_rows: np.ndarray, signature: Tuple[int, int]):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.signature = signature
+
+    @property
+    def list_count(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, engine: RankingEngine, signature: Tuple[int, int], list_count: Optional[int] = None,
+              iterations: int = 10, seed: int = 0) -> "AnnIndex":
+        """
+        对非零向量做球面 k-means，构建倒排表。
+        聚类中心只在最多 list_count * 64 行的样本上训练，然后分块把全部行分配到最近的中心。
+        """
+        rows = np.flatnonzero(engine.magnitudes > 0)
+        vectors = engine.normalized
+        if list_count is None:
+            list_count = max(1, int(np.sqrt(len(rows))))
+        list_count = max(1, min(list_count, len(rows)))
+
+        rng = np.random.default_rng(seed)
+        if len(rows) == 0:
+            centroids = np.zeros((1, len(ATTRIBUTE_KEYS)), dtype=np.float64)
+        else:
+            sample_size = min(len(rows), list_count * 64)
+            sample = vectors[rng.choice(rows, size=sample_size, replace=False)]
+            centroids = sample[rng.choice(sample_size, size=list_count, replace=False)].copy()
+            for _ in range(iterations):
+                assignment = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignment, sample)
+                norms = np.linalg.norm(sums, axis=1)
+                # 空聚类保留原来的中心
+                nonempty = norms > 0
+                centroids[nonempty] = sums[nonempty] / norms[nonempty, np.newaxis]
+
+        assignment = np.empty(len(rows), dtype=np.intp)
+        for start in range(0, len(rows), 65536):
+            chunk = rows[start:start + 65536]
+            assignment[start:start + len(chunk)] = np.argmax(vectors[chunk] @ centroids.T, axis=1)
+
+        order = np.argsort(assignment, kind="stable")
+        list_rows = rows[order]
+        counts = np.bincount(assignment, minlength=len(centroids))
+        list_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.intp)
+        return cls(centroids, list_offsets, list_rows, signature)
+
+    def save(self, filepath: str):
+        index_store.save_npz(filepath, centroids=self.centroids, list_offsets=self.list_offsets,
+                             list_rows=self.list_rows, signature=np.asarray(self.signature, dtype=np.int64))
+
+    @classmethod
+    def load(cls, filepath: str) -> "AnnIndex":
+        with np.load(filepath) as data:
+            return cls(data["centroids"], data["list_offsets"], data["list_rows"],
+                       tuple(int(value) for value in data["signature"]))
+
+    def candidate_rows(self, preference_vector: List[float], top_k: int, probe: int) -> np.ndarray:
+        """返回得分最高的 probe 个聚类中的所有行；候选不足 top_k 时继续扩大探查范围"""
+        preference = np.asarray(preference_vector, dtype=np.float64)
+        norm = np.linalg.norm(preference)
+        if norm == 0:
+            return self.list_rows
+        list_order = np.argsort(-(self.centroids @ (preference / norm)))
+
+        selected: List[np.ndarray] = []
+        total = 0
+        for probed, list_id in enumerate(list_order):
+            if probed >= probe and total >= top_k:
+                break
+            start, end = self.list_offsets[list_id], self.list_offsets[list_id + 1]
+            selected.append(self.list_rows[start:end])
+            total += end - start
+        if not selected:
+            return self.list_rows[:0]
+        return np.sort(np.concatenate(selected))
+
+    def query(self, engine: RankingEngine, preference_vector: List[float], top_k: int,
+              probe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """近似 top-k 查询，返回 (行号, 精确得分)，得分与 cosine_similarity 一致"""
+        probe = probe or config.ANN_PROBE_LISTS
+        rows = self.candidate_rows(preference_vector, top_k, probe)
+        return engine.select_top_rows(rows, preference_vector, top_k)
+
+
+def load_or_build(restaurant_catalog: catalog.Catalog) -> Optional[AnnIndex]:
+    """
+    返回与当前目录对应的索引：优先使用进程内已加载的索引，其次读取索引文件，
+    文件不存在或目录已经变化时重建并保存。
+    """
+    if restaurant_catalog.engine is None:
+        return None
+    return _cached_index.get(restaurant_catalog)
+
+def rebuild(restaurant_catalog: catalog.Catalog, list_count: Optional[int] = None) -> AnnIndex:
+    """重建索引并保存到 config.ANN_INDEX_FILE"""
+    index = AnnIndex.build(restaurant_catalog.engine, restaurant_catalog.signature, list_count)
+    index.save(config.ANN_INDEX_FILE)
+    print(f"ANN index with {index.list_count} lists over {len(index.list_rows)} restaurants saved to {config.ANN_INDEX_FILE}", file=sys.stderr)
+    return index
+
+_cached_index = index_store.CachedIndex("ANN index", lambda: config.ANN_INDEX_FILE, AnnIndex.load, rebuild)
+
+def recommend_from_catalog(restaurant_catalog: catalog.Catalog, user_preference: Dict[str, float],
+                           top_k: int) -> List[Tuple[float, Dict[str, Any]]]:
+    """在整个目录中为用户找出最匹配的 top_k 家餐厅，返回格式与 perform_ranking 相同"""
+    if not all(key in user_preference for key in ATTRIBUTE_KEYS):
+        sys.stderr.write("Error: User profile data is invalid (missing keys).\n")
+        return []
+    index = load_or_build(restaurant_catalog)
+    if index is None:
+        return []
+    engine = restaurant_catalog.engine
+    preference_vector = [user_preference.get(key, 0.5) for key in ATTRIBUTE_KEYS]
+    rows, scores = index.query(engine, preference_vector, top_k)
+    return [(float(score), engine.restaurants[row]) for row, score in zip(rows, scores)]
+
+def measure_recall(index: AnnIndex, engine: RankingEngine, query_count: int, top_k: int,
+                   probe: Optional[int] = None, seed: int = 0) -> float:
+    """用随机偏好向量比较近似 top-k 与精确排序的 top-k，返回平均召回率"""
+    rng = np.random.default_rng(seed)
+    all_rows = np.arange(len(engine), dtype=np.intp)
+    recalls = []
+    for _ in range(query_count):
+        preference_vector = rng.random(len(ATTRIBUTE_KEYS)).tolist()
+        exact_rows, _ = engine.select_top_rows(all_rows, preference_vector, top_k)
+        approximate_rows, _ = index.query(engine, preference_vector, top_k, probe)
+        if len(exact_rows) == 0:
+            continue
+        recalls.append(len(np.intersect1d(exact_rows, approximate_rows)) / len(exact_rows))
+    return float(np.mean(recalls)) if recalls else 1.0
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or evaluate the whole-catalog ANN index.")
+    parser.add_argument("command", choices=["build", "recall"])
+    parser.add_argument("--lists", type=int, default=None, help="number of clusters (default: sqrt of catalog size)")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--probe", type=int, default=None, help="clusters scanned per query")
+    args = parser.parse_args()
+
+    restaurant_catalog = catalog.get_catalog()
+    if restaurant_catalog.engine is None:
+        sys.stderr.write("Failed to load valid restaurant data. Exiting.\n")
+        sys.exit(1)
+
+    if args.command == "build":
+        rebuild(restaurant_catalog, args.lists)
+        return
+
+    index = load_or_build(restaurant_catalog)
+    recall = measure_recall(index, restaurant_catalog.engine, args.queries, args.top_k, args.probe)
+    print(f"recall@{args.top_k} over {args.queries} random queries "
+          f"(lists={index.list_count}, probe={args.probe or config.ANN_PROBE_LISTS}): {recall:.4f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+按属性取值的硬性过滤（例如“便宜”、“离得近”、“评分不低于 0.7”）。
+
+索引为五个属性各保存一份按取值排序的 (取值, 行号) 数组。过滤条件形如 price<=0.3、rating>=0.7，
+每个条件在对应的有序数组上二分查找即可得到满足它的行号区间；多个条件之间是“且”的关系，
+从区间最短的条件开始，只对这一小段候选逐行核对其余条件，之后才交给 RankingEngine 打分，
+不满足条件的餐厅不会参与余弦相似度的计算。没有 attributes 的餐厅不满足任何过滤条件，
+缺少某个属性的餐厅不满足该属性上的条件（排序引擎中缺失的属性记为 0，但不会因此被当作“便宜”或“近”）。
+
+取值以 float64 保存和比较，与排序引擎使用的数值完全相同。
+常用约束的简写（cheap、nearby 等）见 config.ATTRIBUTE_FILTER_SHORTCUTS。
+
+索引保存在 config.ATTRIBUTE_INDEX_FILE 中，记录了目录的签名，目录变化后自动重建。
+
+用法：
+    python attribute_index.py build                          # 重建索引
+    python attribute_index.py filter "cheap,rating>=0.7"     # 输出满足条件的餐厅名字
+"""
+import re
+import sys
+import argparse
+from typing import List, Dict, Any, Tuple, Optional
+
+import numpy as np
+
+import config
+import catalog
+import index_store
+from ranking_engine import RankingEngine, ATTRIBUTE_KEYS
+
+# (属性, 比较运算符, 阈值)
+Predicate = Tuple[str, str, float]
+
+_PREDICATE_PATTERN = re.compile(r"^\s*([a-z]+)\s*(<=|>=|<|>|=)\s*([-+]?(?:\d+\.?\d*|\.\d+))\s*$")
+
+def parse_filters(filters: str) -> List[Predicate]:
+    """
+    解析逗号分隔的过滤条件，简写会先展开为对应的条件。
+    条件无法解析或者属性不存在时抛出 ValueError。
+    """
+    predicates: List[Predicate] = []
+    for clause in filters.split(','):
+        clause = clause.strip()
+        if not clause:
+            continue
+        shortcut = config.ATTRIBUTE_FILTER_SHORTCUTS.get(clause.lower())
+        if shortcut is not None:
+            predicates.extend(parse_filters(shortcut))
+            continue
+        match = _PREDICATE_PATTERN.match(clause.lower())
+        if match is None:
+            raise ValueError(f"Invalid filter '{clause}': expected e.g. price<=0.3 or one of "
+                             f"{', '.join(config.ATTRIBUTE_FILTER_SHORTCUTS)}")
+        attribute, operator, threshold = match.groups()
+        if attribute not in ATTRIBUTE_KEYS:
+            raise ValueError(f"Invalid filter '{clause}': unknown attribute '{attribute}', "
+                             f"expected one of {', '.join(ATTRIBUTE_KEYS)}")
+        predicates.append((attribute, operator, float(threshold)))
+    return predicates
+
+def _matches(values: np.ndarray, operator: str, threshold: float) -> np.ndarray:
+    if operator == "<=":
+        return values <= threshold
+    if operator == "<":
+        return values < threshold
+    if operator == ">=":
+        return values >= threshold
+    if operator == ">":
+        return values > threshold
+    return values == threshold
+
+
+class AttributeIndex:
+    def __init__(self, sorted_values: np.ndarray, sorted_rows: np.ndarray, column_offsets: np.ndarray,
+                 signature: Tuple[int, int]):
+        # ATTRIBUTE_KEYS[i] 的数据位于 [column_offsets[i], column_offsets[i + 1])：
+        # 存在该属性的餐厅按取值 (float64) 升序排列的取值与对应的目录行号
+        self.sorted_values = sorted_values
+        self.sorted_rows = sorted_rows
+        self.column_offsets = column_offsets
+        self.signature = signature
+
+    @classmethod
+    def build(cls, engine: RankingEngine, signature: Tuple[int, int]) -> "AttributeIndex":
+        values_by_column: List[np.ndarray] = []
+        rows_by_column: List[np.ndarray] = []
+        for column in range(len(ATTRIBUTE_KEYS)):
+            rows = np.flatnonzero(engine.present_mask[:, column])
+            values = np.asarray(engine.vectors[rows, column], dtype=np.float64)
+            order = np.argsort(values, kind="stable")
+            values_by_column.append(values[order])
+            rows_by_column.append(rows[order].astype(np.int64))
+        column_offsets = np.concatenate(([0], np.cumsum([len(rows) for rows in rows_by_column]))).astype(np.int64)
+        return cls(np.concatenate(values_by_column), np.concatenate(rows_by_column), column_offsets, signature)
+
+    def save(self, filepath: str):
+        index_store.save_npz(filepath, sorted_values=self.sorted_values, sorted_rows=self.sorted_rows,
+                             column_offsets=self.column_offsets,
+                             signature=np.asarray(self.signature, dtype=np.int64))
+
+    @classmethod
+    def load(cls, filepath: str) -> "AttributeIndex":
+        with np.load(filepath) as data:
+            return cls(data["sorted_values"], data["sorted_rows"], data["column_offsets"],
+                       tuple(int(value) for value in data["signature"]))
+
+    def column(self, attribute: str) -> Tuple[np.ndarray, np.ndarray]:
+        """某个属性的 (升序取值, 行号)"""
+        column = ATTRIBUTE_KEYS.index(attribute)
+        start, end = self.column_offsets[column], self.column_offsets[column + 1]
+        return self.sorted_values[start:end], self.sorted_rows[start:end]
+
+    def range_bounds(self, predicate: Predicate) -> Tuple[int, int]:
+        """满足一个条件的行在该属性有序数组中的区间 [start, end)，二分查找得到"""
+        attribute, operator, threshold = predicate
+        values, _ = self.column(attribute)
+        left = int(np.searchsorted(values, threshold, side="left"))
+        right = int(np.searchsorted(values, threshold, side="right"))
+        if operator == "<=":
+            return 0, right
+        if operator == "<":
+            return 0, left
+        if operator == ">=":
+            return left, len(values)
+        if operator == ">":
+            return right, len(values)
+        return left, right
+
+    def filter_rows(self, engine: RankingEngine, predicates: List[Predicate]) -> np.ndarray:
+        """满足所有条件的行号（升序）"""
+        if not predicates:
+            return np.flatnonzero(engine.has_attributes).astype(np.int64)
+        bounds = [self.range_bounds(predicate) for predicate in predicates]
+        narrowest = min(range(len(predicates)), key=lambda i: bounds[i][1] - bounds[i][0])
+        start, end = bounds[narrowest]
+        rows = self.column(predicates[narrowest][0])[1][start:end]
+        # 其余条件只在最窄区间内的候选上核对，缺少该属性的餐厅不满足条件
+        for i, (attribute, operator, threshold) in enumerate(predicates):
+            if i == narrowest or len(rows) == 0:
+                continue
+            column = ATTRIBUTE_KEYS.index(attribute)
+            values = engine.vectors[rows, column]
+            rows = rows[engine.present_mask[rows, column] & _matches(values, operator, threshold)]
+        return np.sort(rows)
+
+
+def load_or_build(restaurant_catalog: catalog.Catalog) -> Optional[AttributeIndex]:
+    """
+    返回与当前目录对应的索引：优先使用进程内已加载的索引，其次读取索引文件，
+    文件不存在或目录已经变化时重建并保存。
+    """
+    if restaurant_catalog.engine is None:
+        return None
+    return _cached_index.get(restaurant_catalog)
+
+def rebuild(restaurant_catalog: catalog.Catalog) -> AttributeIndex:
+    """重建索引并保存到 config.ATTRIBUTE_INDEX_FILE"""
+    index = AttributeIndex.build(restaurant_catalog.engine, restaurant_catalog.signature)
+    index.save(config.ATTRIBUTE_INDEX_FILE)
+    print(f"Attribute index over {int(np.count_nonzero(restaurant_catalog.engine.has_attributes))} restaurants saved to {config.ATTRIBUTE_INDEX_FILE}",
+          file=sys.stderr)
+    return index
+
+_cached_index = index_store.CachedIndex("attribute index", lambda: config.ATTRIBUTE_INDEX_FILE, AttributeIndex.load, rebuild)
+
+def filter_rows(restaurant_catalog: catalog.Catalog, predicates: List[Predicate]) -> np.ndarray:
+    """目录中满足所有条件的行号（升序）"""
+    index = load_or_build(restaurant_catalog)
+    if index is None:
+        return np.zeros(0, dtype=np.int64)
+    return index.filter_rows(restaurant_catalog.engine, predicates)
+
+def rank_filtered(restaurant_catalog: catalog.Catalog, user_preference: Dict[str, float], predicates: List[Predicate],
+                  restaurant_names: Optional[List[str]] = None, top_k: Optional[int] = None) -> List[Tuple[float, Dict[str, Any]]]:
+    """
+    先用过滤条件裁剪候选集，再按用户画像排序，返回格式与 perform_ranking 相同。
+    restaurant_names 为 None 时候选集为整个目录，否则为这些名字对应的餐厅。
+    """
+    if not all(key in user_preference for key in ATTRIBUTE_KEYS):
+        sys.stderr.write("Error: User profile data is invalid (missing keys).\n")
+        return []
+    engine = restaurant_catalog.engine
+    rows = filter_rows(restaurant_catalog, predicates)
+    if restaurant_names is not None:
+        rows = np.intersect1d(rows, engine.rows_for_names(restaurant_names), assume_unique=True)
+    preference_vector = [user_preference.get(key, 0.5) for key in ATTRIBUTE_KEYS]
+    selected_rows, scores = engine.select_top_rows(rows.astype(np.intp), preference_vector, top_k)
+    return [(float(score), engine.restaurants[row]) for row, score in zip(selected_rows, scores)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the per-attribute range index.")
+    parser.add_argument("command", choices=["build", "filter"])
+    parser.add_argument("filters", nargs="?", default="", help="comma separated filters for 'filter', e.g. cheap,rating>=0.7")
+    args = parser.parse_args()
+
+    restaurant_catalog = catalog.get_catalog()
+    if restaurant_catalog.engine is None:
+        sys.stderr.write("Failed to load valid restaurant data. Exiting.\n")
+        sys.exit(1)
+
+    if args.command == "build":
+        rebuild(restaurant_catalog)
+        return
+    try:
+        predicates = parse_filters(args.filters)
+    except ValueError as e:
+        parser.error(str(e))
+    restaurants = restaurant_catalog.engine.restaurants
+    print(",".join(restaurants[row].get("name", "") for row in filter_rows(restaurant_catalog, predicates).tolist()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+批量排序入口，用于离线评估与夜间预计算。
+
+输入为 JSON Lines 文件，每行一个请求：
+    {"id": "r1", "user": "alice", "names": ["川味小厨", "猪肉荣"], "top_k": 5}
+names 也可以是逗号分隔的字符串；与常驻服务相同，还可以给出 keywords 与 filter 字段，
+names 为空时在全目录中推荐（见 ranker.rank_request）。可选的 profile 字段直接给出用户画像，
+否则使用 user 对应用户的画像（见 user_store.py，没有 user 字段时为默认用户）。
+输出同样是 JSON Lines，每行对应一个请求（顺序与输入一致）：
+    {"id": "r1", "user": "alice", "ranked": [{"name": ..., "score": ...}, ...], "recommendation": ...}
+
+餐厅目录在父进程中加载一次，工作进程通过 fork 共享同一份目录与排序矩阵。
+
+用法：
+    python batch_ranker.py requests.jsonl results.jsonl [--workers N] [--no-llm]
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Iterator
+
+import helper
+import config
+import catalog
+import ranker
+
+def iter_requests(filepath: str) -> Iterator[Dict[str, Any]]:
+    """流式读取请求文件"""
+    return helper.iter_json_records(filepath)
+
+def iter_batches(requests: Iterator[Dict[str, Any]], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """把请求流切分成固定大小的批次，避免一次性把整个输入读入内存"""
+    batch: List[Dict[str, Any]] = []
+    for request in requests:
+        batch.append(request)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def fill_user_profiles(requests: List[Dict[str, Any]]):
+    """为没有 profile 字段的请求填入所属用户的画像，同一批次的用户画像通过一次查询读取"""
+    missing = [request for request in requests if not request.get("profile")]
+    if not missing:
+        return
+    profiles = helper.load_user_profiles(request.get("user") for request in missing)
+    for request in missing:
+        request["profile"] = profiles[request.get("user")]
+
+def rank_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    """在工作进程中对单个请求排序，只返回可序列化的名字与得分。规则与 ranker 命令行和常驻服务相同"""
+    result: Dict[str, Any] = {"id": request.get("id"), "user": request.get("user")}
+    if catalog.get_catalog().engine is None:
+        result["error"] = "Failed to load valid restaurant data."
+        return result
+
+    try:
+        ranked_results, _ = ranker.rank_request(request, request.get("profile"))
+    except ValueError as e:
+        result["error"] = str(e)
+        return result
+    result["ranked"] = [
+        {"name": restaurant.get("name"), "score": score}
+        for score, restaurant in ranked_results
+    ]
+    return result
+
+async def add_recommendations(requests: List[Dict[str, Any]], results: List[Dict[str, Any]], concurrency: int):
+    """
+    为每个结果的第一名生成推荐词。所有请求共享一个 MCP 会话和一个 LLM 连接池，
+    并发数由 concurrency 限制，同时复用推荐词缓存。
+    """
+    # LLM 相关模块只在需要时导入
+    from mcp_client import MCPClient
+    from recommendation_cache import RecommendationCache
+
+    recommendation_cache = RecommendationCache()
+    semaphore = asyncio.Semaphore(concurrency)
+    client = MCPClient()
+    await client.connect_to_server("inprocess")
+
+    async def recommend(request: Dict[str, Any], result: Dict[str, Any]):
+        if not result.get("ranked"):
+            return
+        query = result["ranked"][0]["name"]
+        user_profile_data = request.get("profile") or catalog.get_user_profile(request.get("user"))
+        cache_key = recommendation_cache.make_key(query, user_profile_data, os.getenv("OPENAI_MODEL"))
+        response = recommendation_cache.get(cache_key)
+        if response is None:
+            # 在本地计算第一名的工具结果并放进请求，画像是本请求的画像而不是 MCP 工具中的默认用户
+            top_restaurant = catalog.get_catalog().find(query)
+            tool_results = ranker.prefetch_tool_results(top_restaurant, user_profile_data) if top_restaurant is not None else None
+            async with semaphore:
+                try:
+                    response = await client.process_query(query, tool_results=tool_results, user_id=request.get("user"))
+                except Exception as e:
+                    result["error"] = f"LLM stage failed: {e}"
+                    return
+            recommendation_cache.put(cache_key, response)
+        result["recommendation"] = response
+
+    try:
+        await asyncio.gather(*(recommend(request, result) for request, result in zip(requests, results)))
+    finally:
+        await client.cleanup()
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank many restaurant requests from a JSON Lines file.")
+    parser.add_argument("input", help="JSON Lines file with one ranking request per line")
+    parser.add_argument("output", help="JSON Lines file to write the ranked results to")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--batch-size", type=int, default=1000, help="number of requests read and ranked at a time")
+    parser.add_argument("--no-llm", action="store_true", help="only rank, skip generating recommendations")
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="maximum concurrent LLM requests")
+    args = parser.parse_args()
+
+    # 在创建进程池之前加载目录并构建排序矩阵，fork 出的工作进程直接共享这些内存页
+    restaurant_catalog = catalog.get_catalog()
+    if restaurant_catalog.engine is None:
+        sys.stderr.write("Failed to load valid restaurant data. Exiting.\n")
+        sys.exit(1)
+    catalog.get_user_profile()
+
+    if not args.no_llm:
+        from dotenv import load_dotenv
+        load_dotenv(config.ENV_FILE)
+
+    processed = 0
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as executor, \
+            open(args.output, 'w', encoding='utf-8') as output_file:
+        for batch in iter_batches(iter_requests(args.input), args.batch_size):
+            fill_user_profiles(batch)
+            chunksize = max(1, len(batch) // (args.workers * 4))
+            results = list(executor.map(rank_request, batch, chunksize=chunksize))
+            if not args.no_llm:
+                asyncio.run(add_recommendations(batch, results, args.llm_concurrency))
+            for result in results:
+                output_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+            processed += len(batch)
+            print(f"Processed {processed} requests.", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
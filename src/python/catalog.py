@@ -0,0 +1,146 @@
+import os
+import sys
+import threading
+from typing import Dict, Any, Optional, Tuple, Mapping, Sequence
+
+import helper
+import config
+import tracing
+import user_store
+
+
+class CachedJsonFile:
+    """
+    进程内缓存的 JSON 文件。
+    每次访问只做一次 os.stat，只有文件的 mtime 或大小发生变化时才重新解析。
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._signature: Optional[Tuple[int, int]] = None
+        self._data: Any = None
+        self._lock = threading.Lock()
+
+    def _current_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.filepath)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def load(self) -> Any:
+        """返回文件内容，必要时重新读取"""
+        signature = self._current_signature()
+        if signature is not None and signature == self._signature:
+            return self._data
+        with self._lock:
+            if signature is None or signature != self._signature:
+                with tracing.span(f"json_load:{os.path.basename(self.filepath)}"):
+                    self._data = helper.load_json_data(self.filepath)
+                self._on_reload(self._data)
+                # 读取失败时不记录签名，下次访问会重新尝试
+                self._signature = signature if self._data is not None else None
+        return self._data
+
+    def _on_reload(self, data: Any):
+        """子类可覆盖，在数据重新读取后构建派生结构"""
+        pass
+
+
+class Catalog(CachedJsonFile):
+    """
+    餐厅目录。在 restaurants_info.json 之上维护 名字→记录 的哈希索引，
+    并懒加载供排序使用的向量化引擎。文件变化时自动失效。
+    存在与 JSON 文件对应的编译目录 (compiled_catalog.py) 时直接通过 mmap 使用它，
+    此时 restaurants 是 RestaurantView 组成的只读序列，不再解析 JSON。
+    """
+
+    def __init__(self, filepath: str):
+        self._by_name: Dict[str, Dict[str, Any]] = {}
+        self._engine = None
+        super().__init__(filepath)
+
+    def _on_reload(self, data: Any):
+        self._by_name = {}
+        self._engine = None
+        if not isinstance(data, list):
+            sys.stderr.write(f"Error: Restaurant data in {self.filepath} is not a list.\n")
+            return
+        for record in data:
+            name = record.get("name")
+            # 与原先的线性查找保持一致：同名餐厅以第一条记录为准
+            if name and name not in self._by_name:
+                self._by_name[name] = record
+
+    def compiled(self):
+        """与当前 JSON 文件一致的编译目录 (compiled_catalog.CompiledCatalog)，没有或已过期时为 None"""
+        if not config.USE_COMPILED_CATALOG:
+            return None
+        import compiled_catalog
+        with tracing.span("compiled_catalog_open"):
+            return compiled_catalog.open_if_fresh(self.filepath)
+
+    @property
+    def signature(self) -> Optional[Tuple[int, int]]:
+        """当前已加载数据对应的源 JSON 文件的 (mtime_ns, size)，用于判断派生索引是否过期"""
+        compiled = self.compiled()
+        if compiled is not None:
+            return compiled.source_signature
+        self.load()
+        return self._signature
+
+    @property
+    def restaurants(self) -> Optional[Sequence[Mapping[str, Any]]]:
+        """所有餐厅记录，读取失败时为 None"""
+        compiled = self.compiled()
+        if compiled is not None:
+            return compiled.records
+        data = self.load()
+        return data if isinstance(data, list) else None
+
+    def find(self, name: str) -> Optional[Mapping[str, Any]]:
+        """通过名字查找餐厅记录，JSON 目录为 O(1)，编译目录为 O(log n)"""
+        compiled = self.compiled()
+        if compiled is not None:
+            return compiled.find(name)
+        self.load()
+        return self._by_name.get(name)
+
+    @property
+    def engine(self):
+        """当前目录对应的 ranking_engine.RankingEngine"""
+        compiled = self.compiled()
+        if compiled is not None:
+            return compiled.engine
+        restaurants = self.restaurants
+        if restaurants is None:
+            return None
+        if self._engine is None:
+            self._engine = helper.get_ranking_engine(restaurants)
+        return self._engine
+
+
+_catalogs: Dict[str, Catalog] = {}
+_json_files: Dict[str, CachedJsonFile] = {}
+_registry_lock = threading.Lock()
+
+def get_catalog(filepath: Optional[str] = None) -> Catalog:
+    """返回进程内共享的餐厅目录对象，默认对应 config.RESTAURANTS_FILE"""
+    filepath = filepath or config.RESTAURANTS_FILE
+    with _registry_lock:
+        if filepath not in _catalogs:
+            _catalogs[filepath] = Catalog(filepath)
+        return _catalogs[filepath]
+
+def get_json_file(filepath: str) -> CachedJsonFile:
+    """返回进程内共享的 JSON 文件缓存对象"""
+    with _registry_lock:
+        if filepath not in _json_files:
+            _json_files[filepath] = CachedJsonFile(filepath)
+        return _json_files[filepath]
+
+def get_user_profile(user_id: Optional[str] = None) -> Any:
+    """读取用户画像，默认用户的画像文件未变化时直接返回缓存；数据库中的用户按主键点查"""
+    if user_store.uses_json_files(user_id):
+        return get_json_file(config.USER_PROFILE_FILE).load()
+    return helper.load_user_profile(user_id)
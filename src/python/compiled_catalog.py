@@ -0,0 +1,431 @@
+"""
+编译后的列式餐厅目录。
+
+restaurants_info.json 每次读取都要完整解析，并为每家餐厅创建一个字典；
+编译后的目录把同样的数据按列存放在一个文件中，进程通过 mmap 只读打开，
+多个进程共享同一份页缓存，打开耗时与餐厅数量基本无关：
+    attributes          float64 (n, 5) 属性矩阵，缺失的属性为 0
+    attribute_ints      uint8   (n, 5) JSON 中该属性值是否为整数
+    magnitudes          float64 (n,)   属性向量的模长
+    normalized          float64 (n, 5) 归一化后的属性向量
+    attribute_mask      uint8   (n,)   每家餐厅实际存在的属性（第 i 位对应 ATTRIBUTE_KEYS[i]）
+    field_mask          uint8   (n,)   name / description / attributes 字段是否存在
+    name_offsets, names             名字字符串表 (UTF-8) 与偏移量
+    name_hashes, name_rows          有名字的餐厅按 (名字哈希, 行号) 排序，查找名字时对哈希做 searchsorted
+    description_offsets, descriptions   介绍单独存放在文件末尾，只在读取介绍时才会被换入内存
+属性按 JSON 中的原值以 float64 存储，并记录哪些值是整数，排序得分与 JSON 目录逐位相同；
+模长与归一化向量在编译时算好，排序引擎直接使用映射的列，各进程不会再各自生成一份 float64 副本。
+JSON 中除 name、description、attributes 以外的字段不会被编译。
+
+编译后的文件记录了源 JSON 文件的 (mtime_ns, size)，源文件变化后编译结果自动失效，
+catalog.get_catalog() 退回读取 JSON，直到重新编译。
+
+用法：
+    python compiled_catalog.py build [--input restaurants_info.json] [--output restaurants_info.rcat]
+    python compiled_catalog.py info
+"""
+import os
+import sys
+import json
+import mmap
+import hashlib
+import argparse
+import threading
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+import helper
+import config
+from ranking_engine import RankingEngine, ATTRIBUTE_KEYS, vector_norms
+
+_MAGIC = b"RCATv3\0\0"
+_ALIGNMENT = 64
+
+_HAS_NAME = 1
+_HAS_DESCRIPTION = 2
+_HAS_ATTRIBUTES = 4
+
+def compiled_path(json_path: str) -> str:
+    """JSON 目录对应的编译文件路径"""
+    return os.path.splitext(json_path)[0] + ".rcat"
+
+def _name_hash(name: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(name, digest_size=8).digest(), "little")
+
+def _file_signature(filepath: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class RestaurantView:
+    """
+    编译目录中一家餐厅的只读视图，按需从共享的列中读取字段。
+    提供与餐厅字典相同的 get / [] / in 接口，to_dict() 返回普通字典。
+    """
+    __slots__ = ("_catalog", "_row")
+
+    def __init__(self, compiled_catalog: "CompiledCatalog", row: int):
+        self._catalog = compiled_catalog
+        self._row = row
+
+    def get(self, key: str, default: Any = None) -> Any:
+        catalog_data = self._catalog
+        flags = int(catalog_data.field_mask[self._row])
+        if key == "name":
+            return catalog_data.name(self._row) if flags & _HAS_NAME else default
+        if key == "description":
+            return catalog_data.description(self._row) if flags & _HAS_DESCRIPTION else default
+        if key == "attributes":
+            return catalog_data.attributes(self._row) if flags & _HAS_ATTRIBUTES else default
+        return default
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def keys(self) -> List[str]:
+        return [key for key in ("name", "description", "attributes") if key in self]
+
+    def items(self) -> List[Tuple[str, Any]]:
+        return [(key, self[key]) for key in self.keys()]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, RestaurantView):
+            return self._catalog is other._catalog and self._row == other._row
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash((id(self._catalog), self._row))
+
+    def __repr__(self) -> str:
+        return f"RestaurantView({self.to_dict()!r})"
+
+_MISSING = object()
+
+
+class RecordList:
+    """编译目录中所有餐厅的只读序列，元素为 RestaurantView"""
+    __slots__ = ("compiled",)
+
+    def __init__(self, compiled_catalog: "CompiledCatalog"):
+        self.compiled = compiled_catalog
+
+    def __len__(self) -> int:
+        return self.compiled.count
+
+    def __getitem__(self, row: int) -> RestaurantView:
+        if row < 0:
+            row += self.compiled.count
+        if not 0 <= row < self.compiled.count:
+            raise IndexError(row)
+        return RestaurantView(self.compiled, int(row))
+
+    def __iter__(self) -> Iterator[RestaurantView]:
+        for row in range(self.compiled.count):
+            yield RestaurantView(self.compiled, row)
+
+    def find(self, name: str) -> Optional[RestaurantView]:
+        return self.compiled.find(name)
+
+
+class NameIndex:
+    """名字到行号列表的只读映射，基于编译文件中排好序的名字做二分查找，不需要在内存中构建字典"""
+    __slots__ = ("compiled",)
+
+    def __init__(self, compiled_catalog: "CompiledCatalog"):
+        self.compiled = compiled_catalog
+
+    def get(self, name: str, default: Any = None) -> Any:
+        rows = self.compiled.rows_for_name(name)
+        return rows if rows else default
+
+    def __contains__(self, name: str) -> bool:
+        return bool(self.compiled.rows_for_name(name))
+
+    def __len__(self) -> int:
+        return self.compiled.distinct_names
+
+    def rows_for_names(self, names: Iterable[str]) -> np.ndarray:
+        return self.compiled.rows_for_names(names)
+
+
+
+class CompiledCatalog:
+    """以 mmap 只读打开的编译目录，所有列都是指向映射内存的 numpy 视图"""
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        with open(filepath, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(_MAGIC)] != _MAGIC:
+            if self._mmap[:4] == _MAGIC[:4]:
+                raise ValueError(f"{filepath} was compiled by an older version, rebuild it")
+            raise ValueError(f"{filepath} is not a compiled restaurant catalog")
+        header_length = int.from_bytes(self._mmap[8:16], "little")
+        header = json.loads(self._mmap[16:16 + header_length].decode("utf-8"))
+        if header.get("attribute_keys") != ATTRIBUTE_KEYS:
+            raise ValueError(f"{filepath} was compiled with different attribute keys")
+
+        self.count: int = header["count"]
+        self.distinct_names: int = header["distinct_names"]
+        self.source_signature: Optional[Tuple[int, int]] = tuple(header["source_signature"]) if header.get("source_signature") else None
+        sections = {name: self._section(*spec) for name, spec in header["sections"].items()}
+        self.attribute_matrix: np.ndarray = sections["attributes"].reshape(self.count, len(ATTRIBUTE_KEYS))
+        self.attribute_ints: np.ndarray = sections["attribute_ints"].view(bool).reshape(self.count, len(ATTRIBUTE_KEYS))
+        self.magnitudes: np.ndarray = sections["magnitudes"]
+        self.normalized: np.ndarray = sections["normalized"].reshape(self.count, len(ATTRIBUTE_KEYS))
+        self.attribute_mask: np.ndarray = sections["attribute_mask"]
+        self.field_mask: np.ndarray = sections["field_mask"]
+        self.name_offsets: np.ndarray = sections["name_offsets"]
+        self.name_hashes: np.ndarray = sections["name_hashes"]
+        self.name_rows: np.ndarray = sections["name_rows"]
+        self.description_offsets: np.ndarray = sections["description_offsets"]
+        self._names_start = header["sections"]["names"][0]
+        self._descriptions_start = header["sections"]["descriptions"][0]
+
+        self.records = RecordList(self)
+        self._engine: Optional[RankingEngine] = None
+        self._engine_lock = threading.Lock()
+
+    def _section(self, offset: int, dtype: str, length: int) -> np.ndarray:
+        return np.frombuffer(self._mmap, dtype=np.dtype(dtype), count=length, offset=offset)
+
+    def name_bytes(self, row: int) -> bytes:
+        start = self._names_start + int(self.name_offsets[row])
+        end = self._names_start + int(self.name_offsets[row + 1])
+        return self._mmap[start:end]
+
+    def name(self, row: int) -> str:
+        return self.name_bytes(row).decode("utf-8")
+
+    def description(self, row: int) -> str:
+        start = self._descriptions_start + int(self.description_offsets[row])
+        end = self._descriptions_start + int(self.description_offsets[row + 1])
+        return self._mmap[start:end].decode("utf-8")
+
+    def attributes(self, row: int) -> Dict[str, float]:
+        """属性字典，数值与 JSON 中的原值相同（整数仍为 int）"""
+        mask = int(self.attribute_mask[row])
+        values = self.attribute_matrix[row].tolist()
+        ints = self.attribute_ints[row].tolist()
+        return {key: int(values[i]) if ints[i] else values[i]
+                for i, key in enumerate(ATTRIBUTE_KEYS) if mask & (1 << i)}
+
+    def rows_for_names(self, names: Iterable[str]) -> np.ndarray:
+        """多个名字对应的所有行号（升序、去重），对名字哈希批量 searchsorted 后核对名字本身"""
+        keys = list({name.encode("utf-8") for name in names})
+        if not keys:
+            return np.zeros(0, dtype=np.intp)
+        hashes = np.asarray([_name_hash(key) for key in keys], dtype=np.uint64)
+        lefts = np.searchsorted(self.name_hashes, hashes, side="left")
+        rights = np.searchsorted(self.name_hashes, hashes, side="right")
+        rows: List[int] = []
+        for key, left, right in zip(keys, lefts.tolist(), rights.tolist()):
+            for row in self.name_rows[left:right].tolist():
+                # 哈希相同但名字不同的记录（哈希碰撞）在这里排除
+                if self.name_bytes(row) == key:
+                    rows.append(row)
+        rows.sort()
+        return np.asarray(rows, dtype=np.intp)
+
+    def rows_for_name(self, name: str) -> List[int]:
+        """名字对应的所有行号（升序），O(log n)"""
+        key = name.encode("utf-8")
+        name_hash = np.uint64(_name_hash(key))
+        position = int(self.name_hashes.searchsorted(name_hash))
+        rows: List[int] = []
+        while position < len(self.name_hashes) and self.name_hashes[position] == name_hash:
+            row = int(self.name_rows[position])
+            if self.name_bytes(row) == key:
+                rows.append(row)
+            position += 1
+        return rows
+
+    def find(self, name: str) -> Optional[RestaurantView]:
+        """通过名字查找餐厅，同名餐厅以第一条记录为准"""
+        rows = self.rows_for_name(name)
+        return RestaurantView(self, rows[0]) if rows else None
+
+    @property
+    def engine(self) -> RankingEngine:
+        """直接基于映射的属性矩阵、模长与归一化向量构建的排序引擎，不需要逐行读取记录，也不复制这些列"""
+        with self._engine_lock:
+            if self._engine is None:
+                has_attributes = (self.field_mask & _HAS_ATTRIBUTES).astype(bool) & (self.attribute_mask != 0)
+                present_mask = ((self.attribute_mask[:, np.newaxis] >> np.arange(len(ATTRIBUTE_KEYS), dtype=np.uint8)) & 1).astype(bool)
+                present_mask &= has_attributes[:, np.newaxis]
+                self._engine = RankingEngine(self.records, vectors=self.attribute_matrix,
+                                             has_attributes=has_attributes, name_to_rows=NameIndex(self),
+                                             int_mask=self.attribute_ints, magnitudes=self.magnitudes,
+                                             normalized=self.normalized, present_mask=present_mask)
+            return self._engine
+
+
+def compile_catalog(json_path: str, output_path: str) -> int:
+    """把 JSON 目录编译为列式文件，写入临时文件后原子替换，返回餐厅数量"""
+    source_signature = _file_signature(json_path)
+    restaurants = helper.load_json_data(json_path)
+    if not isinstance(restaurants, list):
+        raise ValueError(f"Restaurant data in {json_path} is not a list")
+
+    count = len(restaurants)
+    attributes = np.zeros((count, len(ATTRIBUTE_KEYS)), dtype=np.float64)
+    attribute_ints = np.zeros((count, len(ATTRIBUTE_KEYS)), dtype=bool)
+    attribute_mask = np.zeros(count, dtype=np.uint8)
+    field_mask = np.zeros(count, dtype=np.uint8)
+    names: List[bytes] = []
+    descriptions: List[bytes] = []
+
+    for row, restaurant in enumerate(restaurants):
+        name = restaurant.get("name")
+        if name is not None:
+            field_mask[row] |= _HAS_NAME
+        names.append(str(name).encode("utf-8") if name is not None else b"")
+        description = restaurant.get("description")
+        if description is not None:
+            field_mask[row] |= _HAS_DESCRIPTION
+        descriptions.append(str(description).encode("utf-8") if description is not None else b"")
+        restaurant_attributes = restaurant.get("attributes")
+        if isinstance(restaurant_attributes, dict):
+            field_mask[row] |= _HAS_ATTRIBUTES
+            for i, key in enumerate(ATTRIBUTE_KEYS):
+                if key in restaurant_attributes:
+                    value = restaurant_attributes[key]
+                    attributes[row, i] = value
+                    attribute_ints[row, i] = isinstance(value, int)
+                    attribute_mask[row] |= 1 << i
+
+    magnitudes, normalized = vector_norms(attributes, attribute_ints)
+
+    def offsets(values: List[bytes]) -> np.ndarray:
+        result = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in values], out=result[1:])
+        return result
+
+    # 没有名字的记录不参与名字索引
+    named_rows = [row for row in range(count) if field_mask[row] & _HAS_NAME]
+    name_hashes = np.asarray([_name_hash(names[row]) for row in named_rows], dtype=np.uint64)
+    name_order = np.lexsort((np.asarray(named_rows, dtype=np.int64), name_hashes))
+    name_rows = np.asarray(named_rows, dtype=np.int64)[name_order]
+    name_hashes = name_hashes[name_order]
+    distinct_names = len({names[row] for row in named_rows})
+
+    # 热数据在前，介绍放在文件末尾
+    sections = [
+        ("attributes", attributes.astype("<f8").tobytes(), "<f8", attributes.size),
+        ("magnitudes", magnitudes.astype("<f8").tobytes(), "<f8", count),
+        ("normalized", normalized.astype("<f8").tobytes(), "<f8", normalized.size),
+        ("attribute_ints", attribute_ints.astype("u1").tobytes(), "u1", attribute_ints.size),
+        ("attribute_mask", attribute_mask.tobytes(), "u1", count),
+        ("field_mask", field_mask.tobytes(), "u1", count),
+        ("name_offsets", offsets(names).astype("<i8").tobytes(), "<i8", count + 1),
+        ("name_hashes", name_hashes.astype("<u8").tobytes(), "<u8", len(name_hashes)),
+        ("name_rows", name_rows.astype("<i8").tobytes(), "<i8", len(name_rows)),
+        ("names", b"".join(names), "u1", sum(len(name) for name in names)),
+        ("description_offsets", offsets(descriptions).astype("<i8").tobytes(), "<i8", count + 1),
+        ("descriptions", b"".join(descriptions), "u1", sum(len(description) for description in descriptions)),
+    ]
+
+    def align(position: int) -> int:
+        return (position + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+    # 头部长度会影响各段的偏移量，先用占位的偏移量估计头部长度，再留出足够的余量
+    header: Dict[str, Any] = {
+        "count": count,
+        "distinct_names": distinct_names,
+        "attribute_keys": ATTRIBUTE_KEYS,
+        "source_signature": list(source_signature) if source_signature else None,
+        "sections": {name: [0, dtype, length] for name, _, dtype, length in sections},
+    }
+    header_capacity = align(16 + len(json.dumps(header).encode("utf-8")) + 32 * len(sections))
+    position = header_capacity
+    for name, data, dtype, length in sections:
+        header["sections"][name][0] = position
+        position = align(position + len(data))
+    header_bytes = json.dumps(header).encode("utf-8")
+
+    temp_path = output_path + ".tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(_MAGIC)
+        f.write(len(header_bytes).to_bytes(8, "little"))
+        f.write(header_bytes)
+        for name, data, _, _ in sections:
+            f.seek(header["sections"][name][0])
+            f.write(data)
+        f.truncate(position)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, output_path)
+    return count
+
+
+_opened: Dict[str, Tuple[Tuple[int, int, int], CompiledCatalog]] = {}
+_opened_lock = threading.Lock()
+
+def open_compiled(filepath: str) -> Optional[CompiledCatalog]:
+    """
+    打开编译目录，文件不存在或无效时返回 None。
+    同一文件只映射一次；文件被重新编译（原子替换）后下次访问会映射新文件。
+    """
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    with _opened_lock:
+        cached = _opened.get(filepath)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        try:
+            compiled_catalog = CompiledCatalog(filepath)
+        except Exception as e:
+            sys.stderr.write(f"Warning: Failed to open compiled catalog {filepath}: {e}. Ignoring it.\n")
+            return None
+        _opened[filepath] = (key, compiled_catalog)
+        return compiled_catalog
+
+def open_if_fresh(json_path: str) -> Optional[CompiledCatalog]:
+    """打开 json_path 对应的编译目录，仅当它由当前版本的 JSON 文件编译而来（或 JSON 文件不存在）时返回"""
+    compiled_catalog = open_compiled(compiled_path(json_path))
+    if compiled_catalog is None:
+        return None
+    source_signature = _file_signature(json_path)
+    if source_signature is not None and compiled_catalog.source_signature != source_signature:
+        return None
+    return compiled_catalog
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile restaurants_info.json into a memory-mapped columnar catalog.")
+    parser.add_argument("command", choices=["build", "info"])
+    parser.add_argument("--input", default=config.RESTAURANTS_FILE)
+    parser.add_argument("--output", default=None, help="compiled file (default: next to the input with a .rcat suffix)")
+    args = parser.parse_args()
+
+    output_path = args.output or compiled_path(args.input)
+    if args.command == "build":
+        count = compile_catalog(args.input, output_path)
+        print(f"Compiled {count} restaurants from {args.input} into {output_path}")
+        return
+
+    compiled_catalog = open_compiled(output_path)
+    if compiled_catalog is None:
+        print(f"No valid compiled catalog at {output_path}")
+        sys.exit(1)
+    fresh = compiled_catalog.source_signature == _file_signature(args.input)
+    print(f"{output_path}: {compiled_catalog.count} restaurants, {compiled_catalog.distinct_names} distinct names, "
+          f"{os.path.getsize(output_path)} bytes, {'up to date' if fresh else 'STALE, rebuild it'}")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,99 @@
 import os
 
-DATA_DIR = "/home/sy/agent/data"
+# 数据目录可以通过环境变量 AGENT_DATA_DIR 覆盖（例如基准测试使用生成的数据）
+DATA_DIR = os.environ.get("AGENT_DATA_DIR", "/home/sy/agent/data")
 RESTAURANTS_FILE = os.path.join(DATA_DIR, "restaurants_info.json")
 USER_PROFILE_FILE = os.path.join(DATA_DIR, "user_profile.json")
-HISTORY_FILE = os.path.join(DATA_DIR, "history.json")
\ No newline at end of file
+HISTORY_FILE = os.path.join(DATA_DIR, "history.jsonl")
+LEGACY_HISTORY_FILE = os.path.join(DATA_DIR, "history.json")
+PROFILE_STATE_FILE = os.path.join(DATA_DIR, "profile_state.json")
+ENV_FILE = os.path.join(DATA_DIR, ".env")
+
+# 用户画像与历史的存储后端：json 时默认用户使用上面的 JSON 文件、其他用户存放在 SQLite 数据库中，
+# sqlite 时所有用户都存放在数据库中 (python user_store.py import-json 可以导入已有的 JSON 数据)
+STORAGE_BACKEND = os.environ.get("AGENT_STORAGE_BACKEND", "json")
+USER_DB_FILE = os.path.join(DATA_DIR, "users.db")
+DEFAULT_USER_ID = "default"
+USER_DB_BUSY_TIMEOUT_SECONDS = 30.0
+
+# 存在由 python compiled_catalog.py build 生成、且与 RESTAURANTS_FILE 一致的编译目录时，通过 mmap 直接使用它
+USE_COMPILED_CATALOG = True
+
+# 历史日志超过该大小后在后台压缩，早于 HISTORY_COMPACT_AFTER_DAYS 天的订单会被折叠为聚合记录；
+# 压缩过一次之后，日志比上次压缩后的大小再增长 HISTORY_COMPACT_GROWTH_BYTES 才会再次压缩
+HISTORY_COMPACT_THRESHOLD_BYTES = 1024 * 1024
+HISTORY_COMPACT_GROWTH_BYTES = 256 * 1024
+HISTORY_COMPACT_AFTER_DAYS = 90
+
+# MCP 连接方式：inprocess 在当前进程内通过内存流直接运行 order_helper 的工具，
+# stdio 为每次查询启动独立的 order_helper 子进程（隔离性最好），
+# sse 连接到一个长期运行的 order_helper 服务 (python order_helper.py sse)。
+# 可以通过环境变量 MCP_TRANSPORT 覆盖。
+MCP_TRANSPORT = "inprocess"
+ORDER_HELPER_SCRIPT = "/home/sy/agent/src/python/order_helper.py"
+MCP_SERVER_HOST = "127.0.0.1"
+MCP_SERVER_PORT = 8765
+MCP_SERVER_URL = f"http://{MCP_SERVER_HOST}:{MCP_SERVER_PORT}/sse"
+
+# LLM 客户端：连接池大小、请求超时，以及一次查询中最多进行的工具调用轮数
+LLM_MAX_CONNECTIONS = 20
+LLM_TIMEOUT_SECONDS = 60.0
+MAX_TOOL_ROUNDS = 4
+
+# 预取工具结果：在连接 MCP 与准备 LLM 客户端的同时，在本地计算排名第一的餐厅的 db_search 与 similarity_calc 结果，
+# 直接放进第一次请求，一次 completion 即可生成推荐词 (ranker.py --no-prefetch 可关闭，模型仍然可以调用工具)
+PREFETCH_TOOL_RESULTS = True
+
+# 推荐词缓存：画像量化步长、最多缓存条目数与过期时间
+RECOMMENDATION_CACHE_FILE = os.path.join(DATA_DIR, "recommendation_cache.json")
+RECOMMENDATION_CACHE_QUANTUM = 0.05
+RECOMMENDATION_CACHE_MAX_ENTRIES = 512
+RECOMMENDATION_CACHE_TTL_SECONDS = 7 * 24 * 3600
+# 命中/未命中计数只在内存中累加，写入新条目时或距上次写入超过该秒数时才合并回文件
+RECOMMENDATION_CACHE_STATS_FLUSH_SECONDS = 60.0
+
+# 流式输出：排序结果立即输出，推荐词逐个片段写到终端 (ranker.py --no-stream 可关闭)
+STREAM_OUTPUT = True
+
+# 全目录推荐：关键字检索没有结果或返回了整个目录时，用近似最近邻索引选出 top-k
+ANN_INDEX_FILE = os.path.join(DATA_DIR, "ann_index.npz")
+ANN_PROBE_LISTS = 8
+WHOLE_CATALOG_TOP_K = 10
+
+# 关键字检索：名字与介绍的单字/双字倒排索引 (ranker.py --keywords 与 MCP 工具 keyword_search 使用)
+KEYWORD_INDEX_FILE = os.path.join(DATA_DIR, "keyword_index.npz")
+KEYWORD_SEARCH_LIMIT = 50
+
+# 属性过滤：每个属性按取值排序的索引 (ranker.py --filter 与 MCP 工具 filter_restaurants 使用)，
+# 以及常用硬性约束的简写，例如 cheap 等价于 price<=0.3
+ATTRIBUTE_INDEX_FILE = os.path.join(DATA_DIR, "attribute_index.npz")
+ATTRIBUTE_FILTER_LIMIT = 50
+ATTRIBUTE_FILTER_SHORTCUTS = {
+    "cheap": "price<=0.3",
+    "便宜": "price<=0.3",
+    "nearby": "distance<=0.3",
+    "近": "distance<=0.3",
+    "top-rated": "rating>=0.7",
+    "好评": "rating>=0.7",
+    "mild": "spiciness<=0.3",
+    "不辣": "spiciness<=0.3",
+    "spicy": "spiciness>=0.7",
+    "辣": "spiciness>=0.7",
+    "sweet": "sweetness>=0.7",
+    "甜": "sweetness>=0.7",
+}
+
+# 常驻服务 (python service.py)：Unix 套接字路径（与 C++ 端 config::SERVICE_SOCKET_PATH 一致）、
+# 同时处理的请求数、排队等待的请求上限（超过时立即返回 busy），以及关闭时等待进行中请求的时间
+SERVICE_SOCKET_PATH = os.path.join(DATA_DIR, "agent.sock")
+SERVICE_MAX_CONCURRENCY = 16
+SERVICE_MAX_PENDING = 256
+SERVICE_MAX_LINE_BYTES = 1 << 20
+SERVICE_SHUTDOWN_TIMEOUT_SECONDS = 30.0
+
+# 分阶段耗时追踪，也可以通过环境变量 AGENT_TRACE=1 或 ranker.py --trace 开启
+TRACE_ENABLED = False
+TRACE_FILE = os.path.join(DATA_DIR, "trace.jsonl")
+# 内存中积累的阶段达到该数量、或距上次导出超过该秒数时追加到 TRACE_FILE，已导出的阶段不再保留在内存中
+TRACE_EXPORT_BATCH_SIZE = 1000
+TRACE_EXPORT_INTERVAL_SECONDS = 10.0
@@ -4,8 +4,10 @@ import os
 import sys
 import datetime
 import numbers
-from typing import List, Dict, Any, Tuple, Set, Optional
+import tempfile
+from typing import List, Dict, Any, Tuple, Optional, Iterable, Iterator
 import config
+import user_store
 
 DEFAULT_USER_PROFILE = {
     "sweetness": 0.5,
@@ -19,8 +21,11 @@ def load_json_data(filepath: str) -> Any:
     """
     从 JSON 文件读取数据。文件保证存在。
     如果读取的是 user_profile.json 且内容无效，则设置默认画像并覆盖文件。
+    .jsonl 文件按行读取，返回所有记录组成的列表。
     其他文件的读取逻辑不变。
     """
+    if filepath.endswith('.jsonl'):
+        return list(iter_json_records(filepath))
     try:
         with open(filepath, 'r', encoding='utf-8') as f:
             data = json.load(f)
@@ -44,13 +49,47 @@ def load_json_data(filepath: str) -> Any:
         sys.stderr.write("Returning None.\n")
         return None
     
+def iter_json_records(filepath: str) -> Iterator[Any]:
+    """
+    逐条读取记录。.jsonl 文件每行一条记录，流式读取；
+    其他文件按 JSON 数组整体读取后逐条返回。文件不存在时不返回任何记录。
+    无法解析的行（例如写入中断留下的半行）会被跳过并给出警告。
+    """
+    if not filepath.endswith('.jsonl'):
+        yield from load_json_data(filepath) or []
+        return
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    sys.stderr.write(f"Warning: Skipping malformed line {line_number} in {filepath}.\n")
+    except FileNotFoundError:
+        return
+
 def save_json_data(data: Any, filepath: str):
-    """将数据保存到 JSON 文件"""
+    """将数据保存到 JSON 文件：先写入同目录下的临时文件再原子替换，读取者不会看到写了一半的文件"""
+    temp_path = None
     try:
-        with open(filepath, 'w', encoding='utf-8') as f:
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filepath)),
+                                         prefix=os.path.basename(filepath) + ".", suffix=".tmp")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=4) # 使用indent=4格式化输出
+        # mkstemp 创建的文件只有属主可读写，沿用原文件的权限
+        try:
+            mode = os.stat(filepath).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o644
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, filepath)
     except Exception as e:
         sys.stderr.write(f"Error occurred while saving data to {filepath}: {e}\n")
+        if temp_path is not None and os.path.exists(temp_path):
+            os.unlink(temp_path)
 
 def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
     """
@@ -80,6 +119,16 @@ def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
     
 DECAY_LAMBDA = 0.05
 
+def attribute_similarities(restaurant: Dict[str, Any], user_preference: Dict[str, float]) -> List[Tuple[str, float]]:
+    """
+    餐厅与用户在每个维度上的余弦相似度（每个维度视为一维向量），按相似度降序排列。
+    MCP 工具 similarity_calc 与 ranker 的预取使用同一份计算，结果一致。
+    """
+    similarities = {}
+    for attr in ["sweetness", "spiciness", "price", "distance", "rating"]:
+        similarities[attr] = cosine_similarity([restaurant["attributes"][attr]], [user_preference[attr]])
+    return sorted(similarities.items(), key=lambda x: x[1], reverse=True)
+
 def calculate_decay_weight(order_date_str: str) -> float:
     """
     计算订单日期的指数衰减权重。
@@ -99,65 +148,65 @@ def calculate_decay_weight(order_date_str: str) -> float:
         sys.stderr.write(f"Error calculating decay weight for {order_date_str}: {e}.\n")
         return 0.0
     
-def perform_ranking(restaurant_names_to_rank: List[str], all_restaurants: List[Dict[str, Any]], user_preference: Dict[str, float]) -> List[Tuple[float, Dict[str, Any]]]:
+_ranking_engine_cache: Tuple[Optional[List[Dict[str, Any]]], Any] = (None, None)
+
+def get_ranking_engine(all_restaurants: List[Dict[str, Any]]):
     """
-    根据用户画像，计算传入名字列表的餐厅与用户偏好的余弦相似度，并对这些餐厅进行排序。
-    ... (函数内容不变) ...
-    """
-    if not all(key in user_preference for key in ["sweetness", "spiciness", "price", "distance", "rating"]):
-        sys.stderr.write("Error: User profile data is invalid (missing keys).\n")
-        return []
-
-    preference_vector = [
-        user_preference.get("sweetness", 0.5),
-        user_preference.get("spiciness", 0.5),
-        user_preference.get("price", 0.5),
-        user_preference.get("distance", 0.5),
-        user_preference.get("rating", 0.5)
-    ]
-
-    ranked_restaurants = []
-    names_to_rank_set: Set[str] = set(restaurant_names_to_rank)
-
-    for restaurant in all_restaurants:
-        restaurant_name = restaurant.get("name")
-        if restaurant_name and restaurant_name in names_to_rank_set:
-            attributes = restaurant.get("attributes")
-            if attributes:
-                restaurant_vector = [
-                    attributes.get("sweetness", 0.0),
-                    attributes.get("spiciness", 0.0),
-                    attributes.get("price", 0.0),
-                    attributes.get("distance", 0.0),
-                    attributes.get("rating", 0.0)
-                ]
-                similarity = cosine_similarity(preference_vector, restaurant_vector)
-                ranked_restaurants.append((similarity, restaurant))
-            else:
-                sys.stderr.write(f"Warning: Restaurant '{restaurant_name}' has no 'attributes'. Giving default score 0.\n")
-                ranked_restaurants.append((0.0, restaurant))
+    返回 all_restaurants 对应的向量化排序引擎。
+    引擎按列表对象缓存，同一份餐厅数据重复排序时不会重新构建矩阵；
+    因此传入的列表在构建引擎后不应再被原地修改。
+    """
+    global _ranking_engine_cache
+    # 编译目录自带基于映射列构建的引擎
+    compiled = getattr(all_restaurants, "compiled", None)
+    if compiled is not None:
+        return compiled.engine
+    cached_restaurants, cached_engine = _ranking_engine_cache
+    if cached_restaurants is not all_restaurants:
+        import ranking_engine
+        cached_engine = ranking_engine.RankingEngine(all_restaurants)
+        _ranking_engine_cache = (all_restaurants, cached_engine)
+    return cached_engine
 
-    ranked_restaurants.sort(key=lambda x: x[0], reverse=True)
+def perform_ranking(restaurant_names_to_rank: List[str], all_restaurants: List[Dict[str, Any]], user_preference: Dict[str, float], top_k: Optional[int] = None) -> List[Tuple[float, Dict[str, Any]]]:
+    """
+    根据用户画像，计算传入名字列表的餐厅与用户偏好的余弦相似度，并对这些餐厅进行排序。
+    计算由 ranking_engine.RankingEngine 向量化完成，结果与逐个调用 cosine_similarity 完全一致。
 
-    return ranked_restaurants
+    Args:
+        restaurant_names_to_rank: 需要排序的餐厅名字列表
+        all_restaurants: 所有餐厅数据
+        user_preference: 用户画像 (5个属性维度)
+        top_k: 只返回得分最高的 top_k 家餐厅，None 表示返回全部
 
-def update_user_profile_from_history(all_restaurants: List[Dict[str, Any]]):
+    Returns:
+        按相似度降序排列的 (score, restaurant) 列表
     """
-    从历史记录文件中读取所有记录，根据指数衰减计算权重，重新生成用户画像 (5个属性维度)。
-    并保存更新后的用户画像文件。
+    engine = get_ranking_engine(all_restaurants)
+    return engine.rank(restaurant_names_to_rank, user_preference, top_k)
+
+def accumulate_history_weights(history_records: Iterable[Dict[str, Any]], all_restaurants: List[Dict[str, Any]]) -> Tuple[Dict[str, float], float, int]:
     """
-    history_records = load_json_data(config.HISTORY_FILE)
-    # load_json_data 已经处理了文件不存在或格式错误的情况，返回 []
+    遍历历史记录，根据指数衰减计算每条记录的权重，累积加权属性总和与总权重。
+    压缩生成的聚合记录带有 weight 与 count 字段，其权重为 weight 乘以基准日的衰减权重。
 
-    # 找到所有餐厅数据，方便通过名字查找属性
-    restaurant_lookup: Dict[str, Dict[str, Any]] = {r.get("name"): r for r in all_restaurants if r.get("name")}
+    Returns:
+        (各属性的加权总和, 总权重, 订单数)
+    """
+    # 找到所有餐厅数据，方便通过名字查找属性；编译目录自带名字索引，不需要逐条建立字典
+    # （同名餐厅时字典以最后一条为准，编译目录以第一条为准）
+    find_restaurant = getattr(all_restaurants, "find", None)
+    if find_restaurant is None:
+        find_restaurant = {r.get("name"): r for r in all_restaurants if r.get("name")}.get
 
     # 初始化用于累积加权属性总和和总权重的字典
     attribute_weighted_sums: Dict[str, float] = {key: 0.0 for key in DEFAULT_USER_PROFILE.keys()}
     total_weight_sum = 0.0
+    order_count = 0
 
     # 遍历历史记录，计算加权属性总和和总权重
     for record in history_records:
+        order_count += record.get("count", 1)
         restaurant_name = record.get("restaurant_name")
         order_date_str = record.get("order_date")
 
@@ -165,12 +214,12 @@ def update_user_profile_from_history(all_restaurants: List[Dict[str, Any]]):
             sys.stderr.write(f"Warning: Skipping invalid history record: {record}\n")
             continue
 
-        weight = calculate_decay_weight(order_date_str)
+        weight = calculate_decay_weight(order_date_str) * record.get("weight", 1.0)
         if weight <= 0:
              continue # 权重为0或负数（未来日期）则忽略
 
         # 查找订单对应的餐厅数据
-        restaurant_data = restaurant_lookup.get(restaurant_name)
+        restaurant_data = find_restaurant(restaurant_name)
 
         if restaurant_data:
             attributes = restaurant_data.get("attributes", {})
@@ -187,8 +236,10 @@ def update_user_profile_from_history(all_restaurants: List[Dict[str, Any]]):
         else:
             sys.stderr.write(f"Warning: Restaurant '{restaurant_name}' from history not found in restaurant data. Skipping.\n")
 
+    return attribute_weighted_sums, total_weight_sum, order_count
 
-    # 根据累积结果生成新的用户画像 (计算加权平均)
+def profile_from_weighted_sums(attribute_weighted_sums: Dict[str, float], total_weight_sum: float) -> Dict[str, float]:
+    """根据加权属性总和与总权重生成用户画像 (计算加权平均)，没有有效记录时返回默认画像"""
     new_user_profile: Dict[str, float] = {}
     if total_weight_sum > 0:
         # 如果有有效的历史记录，计算加权平均值作为新的画像得分
@@ -198,8 +249,57 @@ def update_user_profile_from_history(all_restaurants: List[Dict[str, Any]]):
         # 如果没有有效的历史记录，使用默认画像
         sys.stderr.write("No valid history records with attributes found. Using default user profile.\n")
         new_user_profile = DEFAULT_USER_PROFILE.copy() # 使用copy避免修改默认字典
+    return new_user_profile
+
+def load_user_profile(user_id: Optional[str] = None) -> Dict[str, float]:
+    """
+    读取指定用户的画像，user_id 为空时为默认用户。
+    存放在 JSON 文件中的默认用户沿用 load_json_data 的行为；数据库中没有记录的用户返回默认画像。
+    """
+    if user_store.uses_json_files(user_id):
+        return load_json_data(config.USER_PROFILE_FILE)
+    profile = user_store.get_store().load_profile(user_store.resolve_user_id(user_id))
+    return profile if profile is not None else DEFAULT_USER_PROFILE.copy()
+
+def load_user_profiles(user_ids: Iterable[Optional[str]]) -> Dict[Optional[str], Dict[str, float]]:
+    """批量读取多个用户的画像，数据库中的用户通过一次查询读取"""
+    user_ids = list(dict.fromkeys(user_ids))
+    profiles: Dict[Optional[str], Dict[str, float]] = {}
+    stored_ids = [user_id for user_id in user_ids if not user_store.uses_json_files(user_id)]
+    stored_profiles = user_store.get_store().load_profiles(user_store.resolve_user_id(user_id) for user_id in stored_ids) if stored_ids else {}
+    for user_id in user_ids:
+        if user_store.uses_json_files(user_id):
+            profiles[user_id] = load_json_data(config.USER_PROFILE_FILE)
+        else:
+            profiles[user_id] = stored_profiles.get(user_store.resolve_user_id(user_id)) or DEFAULT_USER_PROFILE.copy()
+    return profiles
+
+def save_user_profile(profile: Dict[str, float], user_id: Optional[str] = None) -> str:
+    """保存指定用户的画像，返回保存位置的描述"""
+    if user_store.uses_json_files(user_id):
+        save_json_data(profile, config.USER_PROFILE_FILE)
+        return config.USER_PROFILE_FILE
+    user_id = user_store.resolve_user_id(user_id)
+    user_store.get_store().save_profile(user_id, profile)
+    return f"{config.USER_DB_FILE} (user '{user_id}')"
+
+def iter_user_history(user_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """逐条读取指定用户的历史记录"""
+    if user_store.uses_json_files(user_id):
+        # 逐行流式读取历史日志，文件不存在时视为没有历史记录
+        return iter_json_records(config.HISTORY_FILE)
+    return user_store.get_store().iter_orders(user_store.resolve_user_id(user_id))
+
+def update_user_profile_from_history(all_restaurants: List[Dict[str, Any]], user_id: Optional[str] = None):
+    """
+    读取指定用户的所有历史记录，根据指数衰减计算权重，重新生成该用户的画像 (5个属性维度)。
+    并保存更新后的用户画像。user_id 为空时为默认用户。
+    """
+    history_records = iter_user_history(user_id)
 
+    attribute_weighted_sums, total_weight_sum, _ = accumulate_history_weights(history_records, all_restaurants)
+    new_user_profile = profile_from_weighted_sums(attribute_weighted_sums, total_weight_sum)
 
     # 保存重新计算后的用户画像
-    save_json_data(new_user_profile, config.USER_PROFILE_FILE)
-    print(f"User profile recalculated and saved to {config.USER_PROFILE_FILE}", file=sys.stderr)
\ No newline at end of file
+    location = save_user_profile(new_user_profile, user_id)
+    print(f"User profile recalculated and saved to {location}", file=sys.stderr)
@@ -0,0 +1,196 @@
+"""
+追加写入的订单历史日志 (JSON Lines)。
+
+每条订单是一行 JSON，通过一次 write + fsync 追加到文件末尾，不再整体重写历史文件。
+日志变大后由压缩步骤把早于 HISTORY_COMPACT_AFTER_DAYS 天的订单按餐厅折叠成聚合记录：
+    {"restaurant_name": ..., "order_date": 折叠基准日, "weight": 衰减权重之和, "count": 订单数}
+由于权重是指数衰减的，聚合记录在任意日期的贡献等于 weight * calculate_decay_weight(order_date)，
+与逐条回放的结果相同。
+
+用法：
+    python history_log.py compact   # 立即压缩历史日志
+"""
+import os
+import sys
+import json
+import math
+import fcntl
+import datetime
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Tuple, Optional
+
+import helper
+import config
+import user_store
+
+@contextmanager
+def _history_lock(exclusive: bool):
+    """
+    历史日志的文件锁。追加写入持有共享锁（O_APPEND 保证多个写入者互不覆盖），
+    压缩持有排他锁，避免压缩替换文件时丢失并发追加的订单。
+    """
+    with open(config.HISTORY_FILE + ".lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def migrate_legacy_history():
+    """如果只存在旧的 JSON 数组格式历史文件，则一次性转换为 JSON Lines 日志"""
+    if os.path.exists(config.HISTORY_FILE) or not os.path.exists(config.LEGACY_HISTORY_FILE):
+        return
+    legacy_records = helper.load_json_data(config.LEGACY_HISTORY_FILE) or []
+    with _history_lock(exclusive=True):
+        if os.path.exists(config.HISTORY_FILE):
+            return
+        _write_log_atomically(legacy_records)
+    print(f"Migrated {len(legacy_records)} history records from {config.LEGACY_HISTORY_FILE} to {config.HISTORY_FILE}", file=sys.stderr)
+
+def iter_history(user_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """逐条读取历史记录（包括聚合记录），不会一次性载入整个文件。user_id 为空时为默认用户"""
+    if not user_store.uses_json_files(user_id):
+        return helper.iter_user_history(user_id)
+    migrate_legacy_history()
+    return helper.iter_json_records(config.HISTORY_FILE)
+
+def append_order(record: Dict[str, Any], user_id: Optional[str] = None):
+    """追加一条订单记录，返回前已经 fsync 落盘（数据库中的用户写入 orders 表）"""
+    if not user_store.uses_json_files(user_id):
+        user_store.get_store().append_orders([(user_store.resolve_user_id(user_id), record)])
+        return
+    migrate_legacy_history()
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with _history_lock(exclusive=False):
+        fd = os.open(config.HISTORY_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode('utf-8'))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+def _write_log_atomically(records: List[Dict[str, Any]]):
+    """把记录写入临时文件并原子替换历史日志"""
+    temp_path = config.HISTORY_FILE + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, config.HISTORY_FILE)
+
+def fold_history(records: Iterator[Dict[str, Any]], cutoff_date: datetime.date) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    把早于等于 cutoff_date 的记录按餐厅折叠为以 cutoff_date 为基准日的聚合记录，
+    其余记录原样保留。返回 (新的记录列表, 被折叠的记录数)。
+    """
+    aggregates: Dict[str, Dict[str, Any]] = {}
+    kept_records: List[Dict[str, Any]] = []
+    folded_count = 0
+
+    for record in records:
+        restaurant_name = record.get("restaurant_name")
+        order_date_str = record.get("order_date")
+        try:
+            order_date = datetime.date.fromisoformat(order_date_str)
+        except (TypeError, ValueError):
+            kept_records.append(record) # 无效记录保留原样，由回放时给出警告
+            continue
+        if not restaurant_name or order_date > cutoff_date:
+            kept_records.append(record)
+            continue
+
+        weight = record.get("weight", 1.0) * math.exp(-helper.DECAY_LAMBDA * (cutoff_date - order_date).days)
+        aggregate = aggregates.setdefault(restaurant_name, {
+            "restaurant_name": restaurant_name,
+            "order_date": cutoff_date.isoformat(),
+            "weight": 0.0,
+            "count": 0,
+        })
+        aggregate["weight"] += weight
+        aggregate["count"] += record.get("count", 1)
+        folded_count += 1
+
+    return list(aggregates.values()) + kept_records, folded_count
+
+def compact_history(keep_days: Optional[int] = None) -> int:
+    """压缩历史日志，返回被折叠的记录数"""
+    if keep_days is None:
+        keep_days = config.HISTORY_COMPACT_AFTER_DAYS
+    migrate_legacy_history()
+    cutoff_date = datetime.date.today() - datetime.timedelta(days=keep_days)
+    with _history_lock(exclusive=True):
+        if not os.path.exists(config.HISTORY_FILE):
+            return 0
+        records, folded_count = fold_history(helper.iter_json_records(config.HISTORY_FILE), cutoff_date)
+        if folded_count:
+            _write_log_atomically(records)
+        _record_compacted_size(os.path.getsize(config.HISTORY_FILE))
+    print(f"Compacted {folded_count} history records older than {cutoff_date.isoformat()}.", file=sys.stderr)
+    return folded_count
+
+def _compacted_size_path() -> str:
+    return config.HISTORY_FILE + ".compacted"
+
+def _record_compacted_size(size: int):
+    """记录压缩后日志的大小（即使没有折叠任何记录），之后按相对它的增长量决定是否再次压缩"""
+    try:
+        with open(_compacted_size_path(), 'w', encoding='utf-8') as f:
+            f.write(str(size))
+    except OSError as e:
+        sys.stderr.write(f"Warning: Failed to record compacted history size: {e}\n")
+
+def _last_compacted_size() -> Optional[int]:
+    """上次压缩后日志的大小，从未压缩过时返回 None"""
+    try:
+        with open(_compacted_size_path(), 'r', encoding='utf-8') as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+_compaction_thread: Optional[threading.Thread] = None
+_compaction_lock = threading.Lock()
+
+def compaction_due() -> bool:
+    """
+    历史日志超过 HISTORY_COMPACT_THRESHOLD_BYTES，并且比上次压缩后的大小增长了
+    HISTORY_COMPACT_GROWTH_BYTES（从未压缩过时只看阈值）时需要压缩。
+    """
+    try:
+        size = os.path.getsize(config.HISTORY_FILE)
+    except OSError:
+        return False
+    if size < config.HISTORY_COMPACT_THRESHOLD_BYTES:
+        return False
+    last_size = _last_compacted_size()
+    # 日志比记录的大小还小说明被替换过，此时只按阈值判断
+    return last_size is None or not last_size <= size < last_size + config.HISTORY_COMPACT_GROWTH_BYTES
+
+def compact_if_needed() -> int:
+    """需要时立即压缩历史日志，返回被折叠的记录数。供下单后即退出的命令行使用"""
+    if not compaction_due():
+        return 0
+    return compact_history()
+
+def compact_in_background_if_needed() -> Optional[threading.Thread]:
+    """
+    需要时在后台线程中压缩历史日志，供长期运行的服务使用；进程内同一时间只有一个压缩线程。
+    压缩线程是守护线程，不会推迟服务退出：新日志写完后才原子替换，
+    中途退出只会丢下临时文件，原日志保持不变，下次满足条件时重新压缩。
+    """
+    global _compaction_thread
+    if not compaction_due():
+        return None
+    with _compaction_lock:
+        if _compaction_thread is not None and _compaction_thread.is_alive():
+            return None
+        _compaction_thread = threading.Thread(target=compact_history, name="history-compaction", daemon=True)
+        _compaction_thread.start()
+        return _compaction_thread
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "compact":
+        sys.stderr.write("Usage: python history_log.py compact [keep_days]\n")
+        sys.exit(1)
+    compact_history(int(sys.argv[2]) if len(sys.argv) > 2 else None)
@@ -0,0 +1,94 @@
+"""
+目录派生索引（ann_index、keyword_index、attribute_index）共用的加载与保存逻辑。
+
+每种索引保存为一个 npz 文件，其中记录了构建时目录的签名。CachedIndex 在进程内缓存已加载的索引，
+签名与当前目录一致时直接返回，不再读取文件；需要读取或重建时在进程内加锁，
+并在 <索引文件>.lock 上持有文件锁，多个进程同时发现索引过期时只会有一个进程重建。
+保存先写同目录下的临时文件再 os.replace，读取者不会看到写了一半的文件。
+"""
+import os
+import sys
+import fcntl
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+import numpy as np
+
+import catalog
+
+def save_npz(filepath: str, **arrays: np.ndarray):
+    """把数组原子地保存为 npz 文件"""
+    directory = os.path.dirname(os.path.abspath(filepath))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(filepath) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, filepath)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+@contextmanager
+def _build_lock(filepath: str) -> Iterator[None]:
+    with open(filepath + ".lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class CachedIndex:
+    """
+    进程内缓存的索引。filepath 在每次加载时调用，以便使用 config 中当前的路径；
+    load 从文件读取索引，rebuild 为目录构建索引并保存。索引对象需要有 signature 属性。
+    """
+
+    def __init__(self, description: str, filepath: Callable[[], str],
+                 load: Callable[[str], Any], rebuild: Callable[[catalog.Catalog], Any]):
+        self.description = description
+        self._filepath = filepath
+        self._load = load
+        self._rebuild = rebuild
+        self._index: Any = None
+        self._lock = threading.Lock()
+
+    def _load_if_current(self, filepath: str, signature: Any) -> Any:
+        if not os.path.exists(filepath):
+            return None
+        try:
+            index = self._load(filepath)
+        except Exception as e:
+            sys.stderr.write(f"Warning: Failed to load {self.description} from {filepath}: {e}. Rebuilding.\n")
+            return None
+        return index if index.signature == signature else None
+
+    def get(self, restaurant_catalog: catalog.Catalog) -> Optional[Any]:
+        """
+        返回与当前目录对应的索引：优先使用进程内已加载的索引，其次读取索引文件，
+        文件不存在或目录已经变化时重建并保存。
+        """
+        signature = restaurant_catalog.signature
+        index = self._index
+        if index is not None and index.signature == signature:
+            return index
+        with self._lock:
+            if self._index is not None and self._index.signature == signature:
+                return self._index
+            filepath = self._filepath()
+            index = self._load_if_current(filepath, signature)
+            if index is None:
+                with _build_lock(filepath):
+                    # 等锁期间其他进程可能已经重建好了
+                    index = self._load_if_current(filepath, signature)
+                    if index is None:
+                        index = self._rebuild(restaurant_catalog)
+            self._index = index
+            return index
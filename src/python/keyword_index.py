@@ -0,0 +1,179 @@
+"""
+餐厅名字与介绍的关键字检索。
+
+对名字和介绍分别切分出单字和相邻两字（bigram），建立 gram → 行号 的倒排表，适合不分词的中文文本。
+长度为 1 或 2 的关键字直接取对应 gram 的倒排表；更长的关键字对其所有 bigram 的倒排表求交集，
+再对交集中的少量候选核对关键字是否真的出现在名字或介绍中。
+多个关键字（逗号分隔）之间是“或”的关系，与 C++ 端 DBInterface::executeQuery 的语义一致（但不区分大小写）。
+查询只读取关键字涉及的倒排表，耗时与这些倒排表的长度成正比，而不是与餐厅总数成正比。
+
+索引保存在 config.KEYWORD_INDEX_FILE 中，记录了目录的签名，目录变化后自动重建。
+
+用法：
+    python keyword_index.py build             # 重建索引
+    python keyword_index.py search 麻辣,海鲜   # 检索并输出匹配的餐厅名字
+"""
+import sys
+import argparse
+from typing import List, Dict, Any, Tuple, Optional, Iterable, Set
+
+import numpy as np
+
+import config
+import catalog
+import index_store
+
+_TEXT_FIELDS = ("name", "description")
+
+def normalize_text(text: str) -> str:
+    return text.lower()
+
+def text_grams(text: str) -> Set[str]:
+    """一段文本中出现的所有单字与相邻两字"""
+    text = normalize_text(text)
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+def parse_keywords(keywords: str) -> List[str]:
+    """按逗号切分关键字，去掉首尾空白与引号，与 C++ 端的解析方式一致"""
+    parsed = []
+    for keyword in keywords.split(','):
+        keyword = keyword.strip().strip('"')
+        if keyword:
+            parsed.append(keyword)
+    return parsed
+
+
+class KeywordIndex:
+    def __init__(self, grams: np.ndarray, offsets: np.ndarray, rows: np.ndarray, signature: Tuple[int, int]):
+        self.grams = grams
+        self.offsets = offsets
+        self.rows = rows
+        self.signature = signature
+
+    @classmethod
+    def build(cls, restaurants: Iterable[Any], signature: Tuple[int, int]) -> "KeywordIndex":
+        postings: Dict[str, List[int]] = {}
+        for row, restaurant in enumerate(restaurants):
+            grams: Set[str] = set()
+            for field in _TEXT_FIELDS:
+                value = restaurant.get(field)
+                if isinstance(value, str):
+                    grams |= text_grams(value)
+            for gram in grams:
+                postings.setdefault(gram, []).append(row)
+
+        sorted_grams = sorted(postings)
+        counts = np.fromiter((len(postings[gram]) for gram in sorted_grams), dtype=np.int64, count=len(sorted_grams))
+        offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        rows = np.fromiter((row for gram in sorted_grams for row in postings[gram]), dtype=np.int64, count=int(offsets[-1]))
+        return cls(np.asarray(sorted_grams, dtype=np.str_), offsets, rows, signature)
+
+    def save(self, filepath: str):
+        index_store.save_npz(filepath, grams=self.grams, offsets=self.offsets, rows=self.rows,
+                             signature=np.asarray(self.signature, dtype=np.int64))
+
+    @classmethod
+    def load(cls, filepath: str) -> "KeywordIndex":
+        with np.load(filepath) as data:
+            return cls(data["grams"], data["offsets"], data["rows"],
+                       tuple(int(value) for value in data["signature"]))
+
+    def postings(self, gram: str) -> np.ndarray:
+        """包含 gram 的行号（升序），二分查找 gram 表"""
+        position = int(np.searchsorted(self.grams, gram))
+        if position >= len(self.grams) or self.grams[position] != gram:
+            return self.rows[:0]
+        return self.rows[self.offsets[position]:self.offsets[position + 1]]
+
+    def candidate_rows(self, keyword: str) -> np.ndarray:
+        """可能包含关键字（已规范化）的行号：关键字所有 bigram 的倒排表的交集，从最短的倒排表开始求交"""
+        if len(keyword) <= 2:
+            return self.postings(keyword)
+        lists = sorted((self.postings(keyword[i:i + 2]) for i in range(len(keyword) - 1)), key=len)
+        candidates = lists[0]
+        for posting in lists[1:]:
+            if len(candidates) == 0:
+                break
+            candidates = np.intersect1d(candidates, posting, assume_unique=True)
+        return candidates
+
+    def search_rows(self, restaurants: Any, keywords: List[str]) -> np.ndarray:
+        """包含任意一个关键字的行号（升序）"""
+        matched: List[np.ndarray] = []
+        for keyword in keywords:
+            needle = normalize_text(keyword)
+            candidates = self.candidate_rows(needle)
+            if len(needle) > 2:
+                # bigram 交集只是必要条件，核对关键字确实连续出现在某个字段中
+                candidates = np.asarray([
+                    row for row in candidates.tolist()
+                    if any(isinstance(value, str) and needle in normalize_text(value)
+                           for value in (restaurants[row].get(field) for field in _TEXT_FIELDS))
+                ], dtype=np.int64)
+            matched.append(candidates)
+        if not matched:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(matched))
+
+
+def load_or_build(restaurant_catalog: catalog.Catalog) -> Optional[KeywordIndex]:
+    """
+    返回与当前目录对应的索引：优先使用进程内已加载的索引，其次读取索引文件，
+    文件不存在或目录已经变化时重建并保存。
+    """
+    if restaurant_catalog.restaurants is None:
+        return None
+    return _cached_index.get(restaurant_catalog)
+
+def rebuild(restaurant_catalog: catalog.Catalog) -> KeywordIndex:
+    """重建索引并保存到 config.KEYWORD_INDEX_FILE"""
+    index = KeywordIndex.build(restaurant_catalog.restaurants, restaurant_catalog.signature)
+    index.save(config.KEYWORD_INDEX_FILE)
+    print(f"Keyword index with {len(index.grams)} grams over {len(restaurant_catalog.restaurants)} restaurants "
+          f"saved to {config.KEYWORD_INDEX_FILE}", file=sys.stderr)
+    return index
+
+_cached_index = index_store.CachedIndex("keyword index", lambda: config.KEYWORD_INDEX_FILE, KeywordIndex.load, rebuild)
+
+def search(keywords: str, restaurant_catalog: Optional[catalog.Catalog] = None) -> List[str]:
+    """
+    检索名字或介绍中包含任意一个关键字（逗号分隔）的餐厅，
+    按目录中的顺序返回去重后的餐厅名字。没有有效关键字时返回空列表。
+    """
+    restaurant_catalog = restaurant_catalog or catalog.get_catalog()
+    parsed = parse_keywords(keywords)
+    if not parsed:
+        return []
+    index = load_or_build(restaurant_catalog)
+    if index is None:
+        return []
+    restaurants = restaurant_catalog.restaurants
+    names: List[str] = []
+    seen: Set[str] = set()
+    for row in index.search_rows(restaurants, parsed).tolist():
+        name = restaurants[row].get("name")
+        if name and name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the keyword (character bigram) index.")
+    parser.add_argument("command", choices=["build", "search"])
+    parser.add_argument("keywords", nargs="?", default="", help="comma separated keywords for 'search'")
+    args = parser.parse_args()
+
+    restaurant_catalog = catalog.get_catalog()
+    if restaurant_catalog.restaurants is None:
+        sys.stderr.write("Failed to load valid restaurant data. Exiting.\n")
+        sys.exit(1)
+
+    if args.command == "build":
+        rebuild(restaurant_catalog)
+        return
+    print(",".join(search(args.keywords, restaurant_catalog)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+MCP 客户端与 LLM 调用。
+
+openai、mcp 与 httpx 的导入开销较大（数百毫秒），因此单独放在本模块中，
+ranker.py 只在确实需要生成推荐词时才导入它；只排序或命中推荐词缓存的运行不会加载这些依赖。
+"""
+import json
+import asyncio
+import os
+import logging
+from typing import List, Dict, Any, Tuple, Optional, Callable
+from contextlib import AsyncExitStack
+
+import httpx
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.client.sse import sse_client
+from mcp.shared.memory import create_connected_server_and_client_session
+
+import config
+import tracing
+import user_store
+
+def create_llm_client() -> AsyncOpenAI:
+    """
+    创建异步 LLM 客户端，底层 httpx 连接池在所有请求之间复用。
+    同一个事件循环中的多个 MCPClient 可以共享同一个客户端。
+    """
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=config.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=config.LLM_MAX_CONNECTIONS,
+        ),
+        timeout=httpx.Timeout(config.LLM_TIMEOUT_SECONDS),
+    )
+    return AsyncOpenAI(http_client=http_client)
+
+class MCPClient:
+    def __init__(self, llm_client: Optional[AsyncOpenAI] = None):
+        self.session: Optional[ClientSession] = None
+        self.exit_stack = AsyncExitStack()
+        # 未传入共享客户端时自己创建一个，并在 cleanup 时关闭
+        self.client = llm_client or create_llm_client()
+        if llm_client is None:
+            self.exit_stack.push_async_callback(self.client.close)
+
+    async def connect_to_server(self, transport: Optional[str] = None):
+        """连接 order_helper MCP 服务，耗时记录为 mcp_connect 阶段"""
+        with tracing.span("mcp_connect"):
+            await self._connect(transport)
+
+    async def _connect(self, transport: Optional[str] = None):
+        """
+        连接 order_helper MCP 服务。
+        transport 为 None 时使用环境变量 MCP_TRANSPORT，未设置则使用 config.MCP_TRANSPORT：
+            inprocess: 在当前进程内通过内存流运行工具，省去子进程启动与 uv 解析的开销
+            sse:       连接到长期运行的 order_helper 服务
+            stdio:     为本次查询启动独立的 order_helper 子进程
+        """
+        transport = transport or os.getenv("MCP_TRANSPORT", config.MCP_TRANSPORT)
+
+        if transport == "inprocess":
+            import order_helper
+            # 导入 order_helper 时 FastMCP 会把根日志配置为 INFO，工具服务与本进程共用终端，
+            # 每次请求的 "Processing request of type …" 和 httpx 的请求行都会打印出来
+            for logger_name in ("mcp", "httpx"):
+                logging.getLogger(logger_name).setLevel(logging.WARNING)
+            # FastMCP 没有公开底层 Server 对象，内存传输需要直接使用它
+            self.session = await self.exit_stack.enter_async_context(
+                create_connected_server_and_client_session(order_helper.app._mcp_server))
+            return
+
+        if transport == "sse":
+            read, write = await self.exit_stack.enter_async_context(
+                sse_client(config.MCP_SERVER_URL))
+        elif transport == "stdio":
+            server_params = StdioServerParameters(
+                command='uv',
+                args=['run', config.ORDER_HELPER_SCRIPT],
+                env=None
+            )
+            read, write = await self.exit_stack.enter_async_context(
+                stdio_client(server_params))
+        else:
+            raise ValueError(f"Unknown MCP transport: {transport}")
+
+        self.session = await self.exit_stack.enter_async_context(
+            ClientSession(read, write))
+
+        await self.session.initialize()
+
+    async def process_query(self, query: str, on_token: Optional[Callable[[str], None]] = None,
+                            tool_results: Optional[Dict[str, str]] = None, user_id: Optional[str] = None) -> str:
+        """
+        为餐厅生成推荐词。传入 on_token 时以流式方式请求 LLM，
+        最终回答的每个片段一到达就交给 on_token 输出。
+        传入 tool_results（工具名 → 已在本地计算好的调用结果）时，结果直接放进第一次请求，
+        模型通常一次 completion 就能给出推荐词；工具仍然提供给模型，信息不足时可以继续调用。
+        user_id 为推荐对象的用户，模型调用带有 user_id 参数的工具（similarity_calc 等）时总是使用这个用户的画像。
+        """
+        system_prompt = (
+            "你是一个非常智能的外卖点单助手，你善于使用精妙但是简洁的语言响应用户的请求"
+            "你可以调用两种外部函数：db_search和similarity_calc来辅助自己的工作，"
+            "需要同时了解多家餐厅时，使用它们的批量版本db_search_batch和similarity_calc_batch，一次调用即可得到所有餐厅的结果"
+            "在所有你认为有必要的时候，都建议你先调用合适的函数，再根据函数的返回结果进行工作"
+            "我们已经根据用户的需求为他筛选出了一条他最有可能感兴趣的餐厅，你可以通过db_search函数得到这家餐厅的信息，\
+                还可以通过similarity_calc函数得到这家餐厅是在哪些维度上与用户的偏好相匹配"
+            "接下来你将得到这家餐厅的名称，然后你将根据上面两个函数的调用结果，为用户生成一则推荐词\
+                需要介绍这家餐厅的信息，并且向用户说明为什么这可能是他最感兴趣的餐厅"
+        )
+        
+        user_content = query
+        if not tool_results:
+            system_prompt += "建议你调用两次函数，然后根据两次结果综合生成你的答案。"
+        else:
+            system_prompt += (
+                "这家餐厅的db_search和similarity_calc调用结果已经附在用户消息中，请直接根据这些结果生成推荐词，"
+                "不需要再调用这两个函数，只有在信息不足时才调用函数。"
+            )
+            user_content = "\n".join(
+                [query] + [f"[{tool_name}({query}) 的调用结果]\n{result}" for tool_name, result in tool_results.items()])
+
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content}
+        ]
+
+        # 获取mcp服务器工具列表
+        with tracing.span("mcp_list_tools"):
+            response = await self.session.list_tools()
+        # 生成function call的描述信息
+        available_tools = [{
+            "type": "function",
+            "function": {
+                "name": tool.name,
+                "description": tool.description,
+                "input_schema": tool.inputSchema
+            }
+        } for tool in response.tools]
+        # 接受 user_id 参数的工具，调用时总是填入本次查询的用户（未指定时为默认用户），
+        # 模型给出的 user_id 一律被覆盖，不能借此读取其他用户的画像
+        tool_user_id = user_store.resolve_user_id(user_id)
+        user_tools = {tool.name for tool in response.tools if "user_id" in (tool.inputSchema or {}).get("properties", {})}
+
+        # print(available_tools)
+
+        # 请求 deepseek，function call 的描述信息通过 tools 参数传入
+        # 模型可以连续多轮调用工具，每一轮中的所有工具调用并发执行
+        for _ in range(config.MAX_TOOL_ROUNDS):
+            finish_reason, message = await self.create_completion(messages, available_tools, on_token)
+            if finish_reason != "tool_calls" or not message.tool_calls:
+                return message.content
+
+            # 将deepseek返回的调用哪个工具数据和工具执行完成后的数据都存入messages中
+            messages.append(message.model_dump())
+            tool_messages = await asyncio.gather(
+                *(self.call_tool(tool_call, tool_user_id if tool_call.function.name in user_tools else None)
+                  for tool_call in message.tool_calls))
+            messages.extend(tool_messages)
+
+        # 超过最大轮数后不再提供工具，要求模型直接根据已有结果生成最终的结果
+        _, message = await self.create_completion(messages, None, on_token)
+        return message.content
+
+    async def create_completion(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]],
+                                on_token: Optional[Callable[[str], None]] = None) -> Tuple[Optional[str], ChatCompletionMessage]:
+        """
+        请求一次 chat completion，返回 (finish_reason, message)。
+        on_token 不为 None 时使用流式响应：文本片段到达即输出，工具调用的增量片段拼接成完整的调用。
+        """
+        request = {"model": os.getenv("OPENAI_MODEL"), "messages": messages}
+        if tools:
+            request["tools"] = tools
+
+        if on_token is None:
+            with tracing.span("llm_completion"):
+                response = await self.client.chat.completions.create(**request)
+            return response.choices[0].finish_reason, response.choices[0].message
+
+        with tracing.span("llm_completion"):
+            return await self._stream_completion(request, on_token)
+
+    async def _stream_completion(self, request: Dict[str, Any], on_token: Callable[[str], None]) -> Tuple[Optional[str], ChatCompletionMessage]:
+        """以流式方式请求一次 chat completion，拼接增量片段"""
+        stream = await self.client.chat.completions.create(stream=True, **request)
+        finish_reason: Optional[str] = None
+        content_parts: List[str] = []
+        tool_call_parts: Dict[int, Dict[str, str]] = {}
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            delta = choice.delta
+            if delta.content:
+                content_parts.append(delta.content)
+                on_token(delta.content)
+            for tool_call_delta in delta.tool_calls or []:
+                part = tool_call_parts.setdefault(tool_call_delta.index, {"id": "", "name": "", "arguments": ""})
+                if tool_call_delta.id:
+                    part["id"] = tool_call_delta.id
+                if tool_call_delta.function:
+                    part["name"] += tool_call_delta.function.name or ""
+                    part["arguments"] += tool_call_delta.function.arguments or ""
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+
+        tool_calls = [
+            ChatCompletionMessageToolCall(
+                id=part["id"], type="function",
+                function=Function(name=part["name"], arguments=part["arguments"]))
+            for _, part in sorted(tool_call_parts.items())
+        ]
+        message = ChatCompletionMessage(
+            role="assistant",
+            content="".join(content_parts) or None,
+            tool_calls=tool_calls or None,
+        )
+        return finish_reason, message
+
+    async def call_tool(self, tool_call, user_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        执行模型请求的一次工具调用，返回对应的 tool 消息。出错时把错误信息返回给模型。
+        user_id 不为 None 时覆盖模型给出的 user_id 参数。
+        """
+        tool_name = tool_call.function.name
+        try:
+            tool_args = json.loads(tool_call.function.arguments or "{}")
+            if user_id is not None:
+                tool_args["user_id"] = user_id
+            with tracing.span(f"mcp_call_tool:{tool_name}"):
+                result = await self.session.call_tool(tool_name, tool_args)
+            result_text = "\n".join(item.text for item in result.content if hasattr(item, "text"))
+        except Exception as e:
+            tool_args = tool_call.function.arguments
+            result_text = f"Error calling tool {tool_name}: {e}"
+        print(f"\n\n[Calling tool {tool_name} with args {tool_args}]\nresult = {result_text}\n\n")
+
+        return {
+            "role": "tool",
+            "content": result_text,
+            "tool_call_id": tool_call.id,
+        }
+
+    async def cleanup(self):
+        """Clean up resources"""
+        await self.exit_stack.aclose()
@@ -1,6 +1,13 @@
+import json
+from typing import List, Dict, Any, Optional
+
+import numpy as np
 from mcp.server import FastMCP
 import helper
 import config
+import catalog
+import tracing
+import ranking_engine
 
 app = FastMCP('order_helper')
 
@@ -15,15 +22,15 @@ async def db_search(query: str) -> str:
     Returns:
         一段中文句子，餐厅的介绍信息
     """
-    all_restaurants_data = helper.load_json_data(config.RESTAURANTS_FILE)
-    if all_restaurants_data is None or not isinstance(all_restaurants_data, list):
+    restaurant_catalog = catalog.get_catalog()
+    if restaurant_catalog.restaurants is None:
         return ""
-    for record in all_restaurants_data:
-        if record["name"] == query:
-            return record["description"]
+    record = restaurant_catalog.find(query)
+    if record is not None:
+        return record["description"]
         
 @app.tool()
-async def similarity_calc(restaurant_name: str) -> str:
+async def similarity_calc(restaurant_name: str, user_id: Optional[str] = None) -> str:
     """
     我们通过向量来标记一家餐厅的属性，它表示这家餐厅在这几个方面的得分比如：
     "attributes": {
@@ -51,23 +58,144 @@ async def similarity_calc(restaurant_name: str) -> str:
 
     Args:
         restaurant_name: 餐厅的名字
+        user_id: 用户 id，不给出时为默认用户
 
     Returns:
         一个字符串，记录了每一个维度的相似度
     """
-    all_restaurants_data = helper.load_json_data(config.RESTAURANTS_FILE)
-    user_profile_data = helper.load_json_data(config.USER_PROFILE_FILE)
-    for restaurant in all_restaurants_data:
-        if restaurant["name"] == restaurant_name:
-            similarities = {}
-            for attr in ["sweetness", "spiciness", "price", "distance", "rating"]:
-                vec1 = [restaurant["attributes"][attr]]
-                vec2 = [user_profile_data[attr]]
-                sim = helper.cosine_similarity(vec1, vec2)
-                similarities[attr] = sim
-            sorted_similarities = sorted(similarities.items(), key=lambda x: x[1], reverse=True)
-            return sorted_similarities
+    restaurant = catalog.get_catalog().find(restaurant_name)
+    user_profile_data = catalog.get_user_profile(user_id)
+    if restaurant is not None:
+        return helper.attribute_similarities(restaurant, user_profile_data)
     return None
         
+def _first_rows(restaurant_catalog: catalog.Catalog, names: List[str]) -> List[Optional[int]]:
+    """每个名字在目录中的第一行（与 find 的语义一致），找不到时为 None"""
+    name_to_rows = restaurant_catalog.engine.name_to_rows
+    rows = []
+    for name in names:
+        matches = name_to_rows.get(name)
+        rows.append(int(matches[0]) if matches else None)
+    return rows
+
+@app.tool()
+async def db_search_batch(queries: List[str]) -> str:
+    """
+    批量版本的 db_search：一次查找多家餐厅的介绍信息，需要同时介绍多家餐厅时使用
+
+    Args:
+        queries: 餐厅名字的列表
+
+    Returns:
+        一个 JSON 字符串，键为餐厅名字，值为餐厅的介绍信息，找不到的餐厅为 null
+    """
+    restaurant_catalog = catalog.get_catalog()
+    if restaurant_catalog.restaurants is None:
+        return "{}"
+    descriptions = {}
+    for name in queries:
+        record = restaurant_catalog.find(name)
+        descriptions[name] = record.get("description") if record is not None else None
+    return json.dumps(descriptions, ensure_ascii=False)
+
+@app.tool()
+async def similarity_calc_batch(restaurant_names: List[str], user_id: Optional[str] = None) -> str:
+    """
+    批量版本的 similarity_calc：一次计算多家餐厅与用户在每个维度上的相似度，需要同时比较多家餐厅时使用
+
+    Args:
+        restaurant_names: 餐厅名字的列表
+        user_id: 用户 id，不给出时为默认用户
+
+    Returns:
+        一个 JSON 字符串，键为餐厅名字，值为按相似度降序排列的 [维度, 相似度] 列表，找不到的餐厅为 null
+    """
+    restaurant_catalog = catalog.get_catalog()
+    engine = restaurant_catalog.engine
+    user_profile_data = catalog.get_user_profile(user_id)
+    if engine is None:
+        return "{}"
+
+    attribute_keys = ranking_engine.ATTRIBUTE_KEYS
+    rows = _first_rows(restaurant_catalog, restaurant_names)
+    found = [row for row in rows if row is not None]
+    # 每个维度是一维向量的余弦相似度：a*b / (sqrt(a*a) * sqrt(b*b))，与 cosine_similarity 逐元素的结果相同
+    restaurant_values = engine.vectors[np.asarray(found, dtype=np.intp)].reshape(len(found), len(attribute_keys))
+    profile_values = np.asarray([user_profile_data[attr] for attr in attribute_keys], dtype=np.float64)
+    magnitudes = np.sqrt(restaurant_values * restaurant_values) * np.sqrt(profile_values * profile_values)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        similarities = np.clip((restaurant_values * profile_values) / magnitudes, -1.0, 1.0)
+    similarities[magnitudes == 0] = 0.0
+
+    results: Dict[str, Any] = {}
+    scores = iter(similarities.tolist())
+    for name, row in zip(restaurant_names, rows):
+        if row is None:
+            results[name] = None
+            continue
+        row_scores = next(scores)
+        results[name] = sorted(zip(attribute_keys, row_scores), key=lambda x: x[1], reverse=True)
+    return json.dumps(results, ensure_ascii=False)
+
+@app.tool()
+async def keyword_search(keywords: str, limit: int = config.KEYWORD_SEARCH_LIMIT) -> str:
+    """
+    通过关键字检索餐厅，名字或介绍中包含任意一个关键字的餐厅都会被返回，
+    例如 "麻辣,海鲜" 会返回所有名字或介绍中含有“麻辣”或“海鲜”的餐厅
+
+    Args:
+        keywords: 逗号分隔的关键字
+        limit: 最多返回的餐厅数量
+
+    Returns:
+        一个字符串，逗号分隔的餐厅名字，没有匹配的餐厅时为空字符串
+    """
+    import keyword_index
+    return ",".join(keyword_index.search(keywords)[:max(0, limit)])
+
+@app.tool()
+async def filter_restaurants(filters: str, limit: int = config.ATTRIBUTE_FILTER_LIMIT,
+                             user_id: Optional[str] = None) -> str:
+    """
+    按属性的硬性条件筛选餐厅，并按与用户偏好的匹配程度从高到低返回。
+    条件之间用逗号分隔且需要同时满足，每个条件形如 price<=0.3、distance<0.5、rating>=0.7，
+    属性为 sweetness、spiciness、price、distance、rating，取值范围 0 到 1；
+    也可以使用简写：cheap/便宜 (price<=0.3)、nearby/近 (distance<=0.3)、top-rated/好评 (rating>=0.7)、
+    mild/不辣 (spiciness<=0.3)、spicy/辣 (spiciness>=0.7)、sweet/甜 (sweetness>=0.7)
+
+    Args:
+        filters: 逗号分隔的过滤条件，例如 "cheap,rating>=0.7"
+        limit: 最多返回的餐厅数量
+        user_id: 用户 id，不给出时为默认用户
+
+    Returns:
+        一个字符串，逗号分隔的餐厅名字，没有满足条件的餐厅时为空字符串
+    """
+    import attribute_index
+    try:
+        predicates = attribute_index.parse_filters(filters)
+    except ValueError as e:
+        return str(e)
+    ranked = attribute_index.rank_filtered(catalog.get_catalog(), catalog.get_user_profile(user_id), predicates,
+                                           top_k=max(0, limit))
+    return ",".join(restaurant.get("name", "") for _, restaurant in ranked)
+
+@app.tool()
+async def trace_stats() -> str:
+    """
+    返回推荐流程各阶段（JSON 读取、排序、MCP 连接、LLM 请求、工具调用、历史与画像写入）的耗时统计，
+    包括次数、平均值和 p50/p95/p99，单位为毫秒。需要开启追踪后才会有数据。
+
+    Returns:
+        一个 JSON 字符串，键为阶段名称
+    """
+    return json.dumps(tracing.summarize(tracing.all_spans()), ensure_ascii=False)
+
 if __name__ == "__main__":
-    app.run(transport='stdio')
\ No newline at end of file
+    import sys
+    # python order_helper.py [stdio|sse]，sse 模式作为长期运行的服务供多个客户端连接
+    transport = sys.argv[1] if len(sys.argv) > 1 else 'stdio'
+    if transport == 'sse':
+        app.settings.host = config.MCP_SERVER_HOST
+        app.settings.port = config.MCP_SERVER_PORT
+    app.run(transport=transport)
\ No newline at end of file
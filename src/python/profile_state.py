@@ -0,0 +1,208 @@
+"""
+用户画像的增量状态。
+
+画像是历史订单属性的指数衰减加权平均。由于指数衰减满足
+    exp(-lambda * (t2 - d)) = exp(-lambda * (t2 - t1)) * exp(-lambda * (t1 - d))
+只需保存某个日期 as_of 下的衰减加权属性总和与总权重，
+新订单到来时先把状态整体按经过的天数缩放，再加上新订单的贡献即可，
+每次下单的开销与历史订单数量无关。
+
+用法：
+    python profile_state.py rebuild   # 全量回放 history 重建状态与画像
+    python profile_state.py check     # 比较增量状态与全量回放的结果
+    python profile_state.py rebuild --user alice   # 针对数据库中的某个用户
+"""
+import sys
+import json
+import math
+import fcntl
+import argparse
+import datetime
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterator, Optional
+
+import helper
+import config
+import catalog
+import history_log
+import user_store
+
+def empty_profile_state(as_of: datetime.date) -> Dict[str, Any]:
+    """返回不包含任何订单的初始状态"""
+    return {
+        "as_of": as_of.isoformat(),
+        "weighted_sums": {key: 0.0 for key in helper.DEFAULT_USER_PROFILE.keys()},
+        "total_weight": 0.0,
+        "order_count": 0,
+    }
+
+@contextmanager
+def _json_profile_lock() -> Iterator[None]:
+    """
+    默认用户（JSON 文件）读取-更新-保存状态与画像期间持有的排他文件锁。
+    使用单独的锁文件而不是历史日志的锁：全量回放会通过 history_log 获取历史日志的共享锁。
+    """
+    with open(config.PROFILE_STATE_FILE + ".lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def load_profile_state(user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """读取增量状态（默认用户为状态文件），不存在或内容无效时返回 None"""
+    try:
+        if user_store.uses_json_files(user_id):
+            with open(config.PROFILE_STATE_FILE, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        else:
+            state = user_store.get_store().load_state(user_store.resolve_user_id(user_id))
+            if state is None:
+                return None
+        datetime.date.fromisoformat(state["as_of"])
+        if not all(key in state["weighted_sums"] for key in helper.DEFAULT_USER_PROFILE.keys()):
+            return None
+        float(state["total_weight"])
+        return state
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        sys.stderr.write(f"Warning: Invalid profile state for user '{user_store.resolve_user_id(user_id)}': {e}. Ignoring it.\n")
+        return None
+
+def save_profile(state: Dict[str, Any], user_id: Optional[str] = None) -> Dict[str, float]:
+    """保存增量状态以及由它得到的用户画像，返回画像。数据库中的用户在同一条语句中写入两者"""
+    new_user_profile = helper.profile_from_weighted_sums(state["weighted_sums"], state["total_weight"])
+    if user_store.uses_json_files(user_id):
+        helper.save_json_data(state, config.PROFILE_STATE_FILE)
+        helper.save_json_data(new_user_profile, config.USER_PROFILE_FILE)
+    else:
+        user_store.get_store().save_profile(user_store.resolve_user_id(user_id), new_user_profile, state)
+    return new_user_profile
+
+def _profile_location(user_id: Optional[str]) -> str:
+    if user_store.uses_json_files(user_id):
+        return config.USER_PROFILE_FILE
+    return f"{config.USER_DB_FILE} (user '{user_store.resolve_user_id(user_id)}')"
+
+def decay_profile_state(state: Dict[str, Any], today: datetime.date) -> Dict[str, Any]:
+    """把状态中的加权总和与总权重按 as_of 到 today 经过的天数整体衰减"""
+    as_of = datetime.date.fromisoformat(state["as_of"])
+    days_elapsed = max(0, (today - as_of).days)
+    factor = math.exp(-helper.DECAY_LAMBDA * days_elapsed)
+    return {
+        "as_of": max(as_of, today).isoformat(),
+        "weighted_sums": {key: value * factor for key, value in state["weighted_sums"].items()},
+        "total_weight": state["total_weight"] * factor,
+        "order_count": state.get("order_count", 0),
+    }
+
+def apply_order(state: Dict[str, Any], restaurant: Dict[str, Any], order_date_str: str) -> Dict[str, Any]:
+    """
+    把一条新订单累加进状态，O(1)。
+    状态需已衰减到今天；权重与全量回放中的 calculate_decay_weight 一致。
+    """
+    restaurant_name = restaurant.get("name")
+    weight = helper.calculate_decay_weight(order_date_str)
+    if weight <= 0:
+        return state
+
+    attributes = restaurant.get("attributes", {})
+    if not (isinstance(attributes, dict) and all(key in attributes for key in helper.DEFAULT_USER_PROFILE.keys())):
+        sys.stderr.write(f"Warning: Restaurant '{restaurant_name}' data has invalid or missing attributes for profile update. Skipping.\n")
+        return state
+
+    for attr_key in helper.DEFAULT_USER_PROFILE.keys():
+        state["weighted_sums"][attr_key] += attributes.get(attr_key, 0.0) * weight
+    state["total_weight"] += weight
+    return state
+
+def rebuild_profile_state(all_restaurants: List[Dict[str, Any]], user_id: Optional[str] = None) -> Dict[str, Any]:
+    """全量回放历史记录，重建增量状态并保存状态与用户画像"""
+    if user_store.uses_json_files(user_id):
+        with _json_profile_lock():
+            return _rebuild_profile_state(all_restaurants, user_id)
+    return _rebuild_profile_state(all_restaurants, user_id)
+
+def _rebuild_profile_state(all_restaurants: List[Dict[str, Any]], user_id: Optional[str]) -> Dict[str, Any]:
+    attribute_weighted_sums, total_weight_sum, order_count = helper.accumulate_history_weights(history_log.iter_history(user_id), all_restaurants)
+
+    state = empty_profile_state(datetime.date.today())
+    state["weighted_sums"] = attribute_weighted_sums
+    state["total_weight"] = total_weight_sum
+    state["order_count"] = order_count
+    save_profile(state, user_id)
+    print(f"User profile recalculated and saved to {_profile_location(user_id)}", file=sys.stderr)
+    return state
+
+def record_order(restaurant: Dict[str, Any], order_date_str: str, all_restaurants: List[Dict[str, Any]], user_id: Optional[str] = None) -> Dict[str, float]:
+    """
+    新订单写入历史记录后调用：增量更新状态并保存新的用户画像。
+    若状态不存在或无效，则退回全量回放（回放结果已包含这条订单）。
+    默认用户在 <状态文件>.lock 的排他文件锁下、数据库中的用户在一个写事务内完成读取、更新与保存，
+    并发下单不会丢失更新。
+    """
+    if user_store.uses_json_files(user_id):
+        with _json_profile_lock():
+            return _record_order(restaurant, order_date_str, all_restaurants, user_id)
+    with user_store.get_store().transaction():
+        return _record_order(restaurant, order_date_str, all_restaurants, user_id)
+
+def _record_order(restaurant: Dict[str, Any], order_date_str: str, all_restaurants: List[Dict[str, Any]], user_id: Optional[str]) -> Dict[str, float]:
+    state = load_profile_state(user_id)
+    if state is None:
+        sys.stderr.write("No valid profile state found. Rebuilding from full history.\n")
+        state = _rebuild_profile_state(all_restaurants, user_id)
+        return helper.profile_from_weighted_sums(state["weighted_sums"], state["total_weight"])
+
+    state = decay_profile_state(state, datetime.date.today())
+    state = apply_order(state, restaurant, order_date_str)
+    state["order_count"] += 1
+    new_user_profile = save_profile(state, user_id)
+    print(f"User profile updated incrementally and saved to {_profile_location(user_id)}", file=sys.stderr)
+    return new_user_profile
+
+def check_profile_state(all_restaurants: List[Dict[str, Any]], tolerance: float = 1e-9, user_id: Optional[str] = None) -> bool:
+    """比较增量状态得到的画像与全量回放得到的画像，差异超过 tolerance 时返回 False"""
+    state = load_profile_state(user_id)
+    if state is None:
+        print("No valid profile state found.")
+        return False
+
+    state = decay_profile_state(state, datetime.date.today())
+    incremental_profile = helper.profile_from_weighted_sums(state["weighted_sums"], state["total_weight"])
+
+    attribute_weighted_sums, total_weight_sum, order_count = helper.accumulate_history_weights(history_log.iter_history(user_id), all_restaurants)
+    replay_profile = helper.profile_from_weighted_sums(attribute_weighted_sums, total_weight_sum)
+
+    consistent = True
+    for attr_key in helper.DEFAULT_USER_PROFILE.keys():
+        difference = abs(incremental_profile[attr_key] - replay_profile[attr_key])
+        if difference > tolerance:
+            consistent = False
+        print(f"{attr_key}: incremental={incremental_profile[attr_key]:.12f} replay={replay_profile[attr_key]:.12f} diff={difference:.3e}")
+    if state.get("order_count", 0) != order_count:
+        print(f"Order count mismatch: state={state.get('order_count', 0)} history={order_count}")
+        consistent = False
+    print("Profile state is consistent." if consistent else "Profile state is INCONSISTENT, run 'rebuild'.")
+    return consistent
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the incremental user profile state.")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    parser.add_argument("--tolerance", type=float, default=1e-9)
+    parser.add_argument("--user", default=None, help="user id (default: the default user)")
+    args = parser.parse_args()
+
+    all_restaurants_data = catalog.get_catalog().restaurants
+    if all_restaurants_data is None:
+        sys.stderr.write("Failed to load valid restaurant data. Exiting.\n")
+        sys.exit(1)
+
+    if args.command == "rebuild":
+        rebuild_profile_state(all_restaurants_data, args.user)
+        sys.exit(0)
+    sys.exit(0 if check_profile_state(all_restaurants_data, args.tolerance, args.user) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -1,181 +1,259 @@
-import json
+import time
+
+_import_start = time.perf_counter()
+
+import sys
 import asyncio
+import argparse
 import os
+import json
 import datetime
-from typing import List, Dict, Any, Tuple, Set, Optional
-from contextlib import AsyncExitStack
-
-from openai import OpenAI
-from dotenv import load_dotenv
-
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+from typing import List, Dict, Any, Tuple, Optional
 
 import helper
 import config
+import catalog
+import profile_state
+import history_log
+import ann_index
+import tracing
+from recommendation_cache import RecommendationCache
+
+# ranker 自身依赖的导入耗时，开启追踪后记录为 import:ranker 阶段，便于发现启动时间的回退
+_import_seconds = time.perf_counter() - _import_start
+
+def load_environment():
+    """读取 .env 中的 LLM 配置（模型名称、API 地址与密钥），只在需要推荐词时调用"""
+    with tracing.span("import:dotenv"):
+        from dotenv import load_dotenv
+        load_dotenv(config.ENV_FILE)
+
+def load_llm_stack():
+    """
+    导入 MCP/LLM 客户端模块并返回。
+    只在推荐词缓存未命中、确实需要请求 LLM 时调用，只排序的运行不会导入 openai、mcp 与 httpx。
+    """
+    with tracing.span("import:llm_stack"):
+        import mcp_client
+    return mcp_client
+
+def prefetch_tool_results(restaurant: Dict[str, Any], user_profile: Dict[str, float]) -> Optional[Dict[str, str]]:
+    """
+    在本地计算推荐词需要的 db_search 与 similarity_calc 结果（与 MCP 工具使用相同的计算）。
+    计算失败时返回 None，由模型自己调用工具。
+    """
+    with tracing.span("prefetch_tool_results"):
+        try:
+            tool_results = {}
+            description = restaurant.get("description")
+            if description is not None:
+                tool_results["db_search"] = description
+            tool_results["similarity_calc"] = json.dumps(helper.attribute_similarities(restaurant, user_profile), ensure_ascii=False)
+            return tool_results
+        except Exception as e:
+            sys.stderr.write(f"Warning: Failed to prefetch tool results for {restaurant.get('name')}: {e}. Falling back to tool calls.\n")
+            return None
+
+def rank_candidates(restaurant_catalog: catalog.Catalog, user_profile_data: Dict[str, float], names: List[str],
+                    keywords: Optional[str] = None, filters: Optional[List[Any]] = None,
+                    top_k: int = config.WHOLE_CATALOG_TOP_K) -> List[Tuple[float, Dict[str, Any]]]:
+    """
+    选出候选餐厅并排序：显式给出的名字与关键字检索的结果合并为候选集；
+    给出过滤条件（attribute_index.parse_filters 的结果）时先用属性索引裁剪候选集；
+    候选集为空或覆盖了整个目录时，在全目录中推荐 top_k 家。ranker 命令行与常驻服务共用这一规则。
+    """
+    restaurant_names_to_rank = list(names)
+    if keywords is not None:
+        # 关键字检索的结果与显式给出的名字合并作为候选
+        import keyword_index
+        with tracing.span("keyword_search"):
+            restaurant_names_to_rank.extend(keyword_index.search(keywords, restaurant_catalog))
+
+    # 关键字检索没有结果或者返回了整个目录时，关键字不起筛选作用，改为用索引在全目录中推荐
+    with tracing.span("ranking"):
+        # 按目录中实际存在的餐厅判断，目录中没有的名字不会让候选集看起来覆盖了整个目录
+        engine = restaurant_catalog.engine
+        whole_catalog = not restaurant_names_to_rank or len(engine.rows_for_names(restaurant_names_to_rank)) == len(engine)
+        if filters:
+            # 过滤条件先用属性索引裁剪候选集，只对满足条件的餐厅打分
+            import attribute_index
+            return attribute_index.rank_filtered(
+                restaurant_catalog, user_profile_data, filters,
+                None if whole_catalog else restaurant_names_to_rank, top_k if whole_catalog else None)
+        if whole_catalog:
+            return ann_index.recommend_from_catalog(restaurant_catalog, user_profile_data, top_k)
+        return helper.perform_ranking(restaurant_names_to_rank, restaurant_catalog.restaurants, user_profile_data)
+
+def rank_request(request: Dict[str, Any], user_profile_data: Optional[Dict[str, float]] = None
+                 ) -> Tuple[List[Tuple[float, Dict[str, Any]]], Dict[str, float]]:
+    """
+    按 JSON 请求排序，常驻服务与批量排序共用，规则与命令行相同（见 rank_candidates）。
+    请求字段：names（列表或逗号分隔的字符串）、keywords、filter、top_k、user。
+    user_profile_data 为 None 时使用 user 对应用户的画像。显式给出 top_k 时最多返回 top_k 家。
+    返回 (排序结果, 所用的用户画像)；参数无效时抛出 ValueError。
+    """
+    names = request.get("names") or []
+    if isinstance(names, str):
+        names = [name for name in names.split(',') if name]
+    filters = None
+    if request.get("filter"):
+        import attribute_index
+        filters = attribute_index.parse_filters(request["filter"])
+    top_k = request.get("top_k") or config.WHOLE_CATALOG_TOP_K
+
+    if user_profile_data is None:
+        user_profile_data = catalog.get_user_profile(request.get("user"))
+    ranked_results = rank_candidates(catalog.get_catalog(), user_profile_data, names,
+                                     request.get("keywords"), filters, top_k)
+    if request.get("top_k"):
+        ranked_results = ranked_results[:top_k]
+    return ranked_results, user_profile_data
+
+def format_ranked_results(ranked_results: List[Tuple[float, Dict[str, Any]]]) -> str:
+    """排序结果的终端显示：序号、餐厅名字和相似度得分"""
+    lines = ["", "--- Ranked Restaurants ---"]
+    for i, (score, restaurant) in enumerate(ranked_results):
+        lines.append(f"{i+1}. {restaurant.get('name', 'Unknown')} (Similarity: {score:.4f})")
+    return "\n".join(lines) + "\n"
+
+def place_order(restaurant: Dict[str, Any], all_restaurants_data: List[Dict[str, Any]], user_id: Optional[str] = None) -> str:
+    """
+    把订单写入用户的历史日志并增量更新用户画像，返回下单日期。
+    不压缩历史日志：命令行在输出下单结果后调用 history_log.compact_if_needed()，
+    长期运行的服务调用 history_log.compact_in_background_if_needed()。
+    """
+    order_date = datetime.date.today().isoformat()
+    history_record = {
+        "restaurant_name": restaurant.get("name", "Unknown"),
+        "order_date": order_date,
+    }
+
+    # 以追加方式写入历史日志，不再重写整个历史文件
+    with tracing.span("history_append"):
+        history_log.append_order(history_record, user_id)
+
+    # 将新订单增量累加进画像状态，重新生成用户画像
+    with tracing.span("profile_update"):
+        profile_state.record_order(restaurant, order_date, all_restaurants_data, user_id)
+    return order_date
 
-load_dotenv("/home/sy/agent/data/.env")
-
-class MCPClient:
-    def __init__(self):
-        self.session: Optional[ClientSession] = None
-        self.exit_stack = AsyncExitStack()
-        self.client = OpenAI()
-
-    async def connect_to_server(self):
-        server_params = StdioServerParameters(
-            command='uv',
-            args=['run', '/home/sy/agent/src/python/order_helper.py'],
-            env=None
-        )
-
-        stdio_transport = await self.exit_stack.enter_async_context(
-            stdio_client(server_params))
-        stdio, write = stdio_transport
-        self.session = await self.exit_stack.enter_async_context(
-            ClientSession(stdio, write))
-
-        await self.session.initialize()
-
-    async def process_query(self, query: str) -> str:
-        system_prompt = (
-            "你是一个非常智能的外卖点单助手，你善于使用精妙但是简洁的语言响应用户的请求"
-            "你可以并且仅可以调用两种外部函数：db_search和similarity_calc来辅助自己的工作"
-            "在所有你认为有必要的时候，都建议你先调用合适的函数，再根据函数的返回结果进行工作"
-            "我们已经根据用户的需求为他筛选出了一条他最有可能感兴趣的餐厅，你可以通过db_search函数得到这家餐厅的信息，\
-                还可以通过similarity_calc函数得到这家餐厅是在哪些维度上与用户的偏好相匹配"
-            "接下来你将得到这家餐厅的名称，然后你将根据上面两个函数的调用结果，为用户生成一则推荐词\
-                需要介绍这家餐厅的信息，并且向用户说明为什么这可能是他最感兴趣的餐厅"
-            "建议你调用两次函数，然后根据两次结果综合生成你的答案。"
-        )
-        
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": query}
-        ]
-
-        # 获取mcp服务器工具列表
-        response = await self.session.list_tools()
-        # 生成function call的描述信息
-        available_tools = [{
-            "type": "function",
-            "function": {
-                "name": tool.name,
-                "description": tool.description,
-                "input_schema": tool.inputSchema
-            }
-        } for tool in response.tools]
-
-        # print(available_tools)
-
-        # 请求 deepseek，function call 的描述信息通过 tools 参数传入
-        response = self.client.chat.completions.create(
-            model=os.getenv("OPENAI_MODEL"),
-            messages=messages,
-            tools=available_tools
-        )
-
-        # print(response.choices[0])
-
-        # 处理返回的内容
-        while True:
-            content = response.choices[0]
-            if content.finish_reason == "tool_calls":
-                tool_call0 = content.message.tool_calls[0]
-                tool_name0 = tool_call0.function.name
-                tool_args0 = json.loads(tool_call0.function.arguments)
-
-                tool_call1 = content.message.tool_calls[1]
-                tool_name1 = tool_call1.function.name
-                tool_args1 = json.loads(tool_call1.function.arguments)
-
-                # 执行工具
-                result0 = await self.session.call_tool(tool_name0, tool_args0)
-                print(f"\n\n[Calling tool {tool_name0} with args {tool_args0}]\nresult = {result0}\n\n")
-
-                result1 = await self.session.call_tool(tool_name1, tool_args1)
-                print(f"\n\n[Calling tool {tool_name1} with args {tool_args1}]\nresult = {result1}\n\n")
-
-                # 将deepseek返回的调用哪个工具数据和工具执行完成后的数据都存入messages中
-                messages.append(content.message.model_dump())
-                messages.append({
-                    "role": "tool",
-                    "content": result0.content[0].text,
-                    "tool_call_id": tool_call0.id,
-                })
-                messages.append({
-                    "role": "tool",
-                    "content": result1.content[0].text,
-                    "tool_call_id": tool_call1.id,
-                })
-
-                # 将上面的结果再返回给deepseek用于生产最终的结果
-                response = self.client.chat.completions.create(
-                    model=os.getenv("OPENAI_MODEL"),
-                    messages=messages,
-                )
-            else:
-                return response.choices[0].message.content
-
-    async def cleanup(self):
-        """Clean up resources"""
-        await self.exit_stack.aclose()
-    
 # --- Synchronous main function ---
 def main():
     """Synchronous main function to run the client for a single query."""
-    client = MCPClient()
-
-    import sys
-    if len(sys.argv) < 2:
-        sys.stderr.write("Usage: python your_ranking_script.py <comma_separated_names_string>\n")
-        sys.exit(1)
-    comma_separated_names_string = sys.argv[1]
-
-    all_restaurants_data = helper.load_json_data(config.RESTAURANTS_FILE)
-    if all_restaurants_data is None or not isinstance(all_restaurants_data, list):
+    parser = argparse.ArgumentParser(description="Rank candidate restaurants for the user and generate a recommendation.")
+    parser.add_argument("names", nargs="?", default="",
+                        help="comma separated restaurant names to rank; empty to recommend from the whole catalog")
+    parser.add_argument("--keywords", default=None,
+                        help="comma separated keywords; rank the restaurants whose name or description contains any of them")
+    parser.add_argument("--filter", default=None,
+                        help="comma separated hard constraints the restaurants must all satisfy, e.g. cheap,rating>=0.7")
+    parser.add_argument("--top-k", type=int, default=config.WHOLE_CATALOG_TOP_K,
+                        help="number of restaurants recommended from the whole catalog")
+    parser.add_argument("--user", default=None,
+                        help="user id whose profile and history are used (default: the default user)")
+    parser.add_argument("--trace", action="store_true",
+                        help="record per-stage latencies to the trace file (summarize with tracing.py)")
+    parser.add_argument("--no-llm", action="store_true",
+                        help="only rank and record the order, skip the MCP/LLM recommendation (faster startup)")
+    parser.add_argument("--no-stream", action="store_true",
+                        help="wait for the whole recommendation instead of streaming tokens as they arrive")
+    parser.add_argument("--no-prefetch", action="store_true",
+                        help="let the model fetch the restaurant data through tool calls instead of embedding it in the first request")
+    args = parser.parse_args()
+    comma_separated_names_string = args.names
+    stream_output = config.STREAM_OUTPUT and not args.no_stream
+    prefetch_enabled = config.PREFETCH_TOOL_RESULTS and not args.no_prefetch
+    if args.trace:
+        tracing.enable()
+    tracing.record("import:ranker", _import_seconds)
+
+    restaurant_catalog = catalog.get_catalog()
+    all_restaurants_data = restaurant_catalog.restaurants
+    if all_restaurants_data is None:
         sys.stderr.write("Failed to load valid restaurant data. Exiting.\n")
         sys.exit(1)
 
-    user_profile_data = helper.load_json_data(config.USER_PROFILE_FILE)
+    user_profile_data = catalog.get_user_profile(args.user)
 
     restaurant_names_to_rank: List[str] = []
     if comma_separated_names_string:
         restaurant_names_to_rank = comma_separated_names_string.split(',')
 
-    ranked_results = helper.perform_ranking(restaurant_names_to_rank, all_restaurants_data, user_profile_data)
+    filters = None
+    if args.filter:
+        import attribute_index
+        try:
+            filters = attribute_index.parse_filters(args.filter)
+        except ValueError as e:
+            parser.error(str(e))
+
+    ranked_results = rank_candidates(restaurant_catalog, user_profile_data, restaurant_names_to_rank,
+                                     args.keywords, filters, args.top_k)
+
+    # 排序结果不依赖 LLM，计算完成后立即输出
+    if ranked_results:
+        print(format_ranked_results(ranked_results), flush=True)
 
     # Define an async function to run the core async logic
-    async def run_single_query() -> str:
+    recommendation_cache = RecommendationCache()
+
+    def print_token(token: str):
+        print(token, end="", flush=True)
+
+    async def run_single_query() -> Tuple[Optional[str], bool]:
+        """返回 (推荐词, 是否已经流式输出到终端)"""
+        client = None
         try:
+            query = ranked_results[0][1].get("name")
+            # 餐厅和用户画像没有明显变化时直接使用缓存的推荐词，跳过 MCP 连接和 LLM 请求
+            cache_key = recommendation_cache.make_key(query, user_profile_data, os.getenv("OPENAI_MODEL"))
+            cached_response = recommendation_cache.get(cache_key)
+            if cached_response is not None:
+                print(f"[Using cached recommendation, cache stats: {recommendation_cache.stats}]", file=sys.stderr)
+                return cached_response, False
+
+            # 预取的工具结果在线程池中计算，与导入 MCP/LLM 客户端、连接 MCP 服务同时进行
+            prefetch = None
+            if prefetch_enabled:
+                prefetch = asyncio.get_running_loop().run_in_executor(
+                    None, prefetch_tool_results, ranked_results[0][1], user_profile_data)
+
+            # 缓存未命中时才导入 MCP/LLM 客户端
+            client = load_llm_stack().MCPClient()
             # Connect to the server
             await client.connect_to_server()
-            query = ranked_results[0][1].get("name")
-            return await client.process_query(query)
+            tool_results = await prefetch if prefetch is not None else None
+            response = await client.process_query(query, on_token=print_token if stream_output else None,
+                                                  tool_results=tool_results, user_id=args.user)
+            recommendation_cache.put(cache_key, response)
+            return response, stream_output
 
-        except Exception as e:
+        except Exception:
             import traceback
             print("\nAn unexpected error occurred:")
             traceback.print_exc()
+            return None, False
         finally:
             # Ensure cleanup happens
-            await client.cleanup()
-
-    # Run the async function using asyncio.run()
-    try:
-        response = asyncio.run(run_single_query())
-    except KeyboardInterrupt:
-        print("\nOperation cancelled by user.")
+            if client is not None:
+                await client.cleanup()
 
     selected_restaurant_data: Optional[Dict[str, Any]] = None # 使用Optional类型提示
     
     if ranked_results:
-        print("\n--- Ranked Restaurants ---")
-        for i, (score, restaurant) in enumerate(ranked_results):
-            # 显示序号、餐厅名字和相似度得分
-            print(f"{i+1}. {restaurant.get('name', 'Unknown')} (Similarity: {score:.4f})")
+        if not args.no_llm:
+            load_environment()
+            # Run the async function using asyncio.run()
+            response, streamed = None, False
+            try:
+                response, streamed = asyncio.run(run_single_query())
+            except KeyboardInterrupt:
+                print("\nOperation cancelled by user.")
 
-        print(response)
+            if streamed:
+                print()
+            else:
+                print(response)
 
         # 交互式选择
         while selected_restaurant_data is None:
@@ -199,25 +277,15 @@ def main():
                 print(f"An unexpected error occurred during selection: {e}")
                 sys.exit(1) # 选择过程中发生未知错误
         
-        # 6. 将点单记录写入历史文件
-        order_date = datetime.date.today().isoformat()
-
-        history_record = {
-            "restaurant_name": selected_restaurant_data.get("name", "Unknown"),
-            "order_date": order_date,
-        }
-
-        # 加载现有历史记录，添加新记录，然后保存
-        current_history = helper.load_json_data(config.HISTORY_FILE)
-        current_history.append(history_record)
-        helper.save_json_data(current_history, config.HISTORY_FILE)
-
+        # 6. 将点单记录写入历史文件，7. 将新订单增量累加进画像状态，重新生成用户画像
+        place_order(selected_restaurant_data, all_restaurants_data, args.user)
         print("\nOrder placed successfully!")
         print(f"Your order for {selected_restaurant_data.get('name', 'Unknown')} has been recorded in history.")
+        print("User profile updated with the new order.", flush=True)
 
-        # 7. 读取history文件，根据记录重新计算并生成用户画像
-        print("Recalculating user profile based on order history...")
-        helper.update_user_profile_from_history(all_restaurants_data)
+        # 下单结果已经输出，退出前同步压缩历史日志（后台线程会随 sys.exit 一起结束，来不及完成）
+        with tracing.span("history_compaction"):
+            history_log.compact_if_needed()
 
         sys.exit(0) # 程序正常结束
 
@@ -226,7 +294,8 @@ def main():
         print("\nNo restaurants found matching your criteria.")
         # 尽管没有点餐，仍然可以根据历史记录更新画像（基于可能存在的历史记录）
         print("\nAttempting to update user profile from existing history...")
-        helper.update_user_profile_from_history(all_restaurants_data)
+        with tracing.span("profile_update"):
+            profile_state.rebuild_profile_state(all_restaurants_data, args.user)
         print("\nProgram finished.")
         sys.exit(0)
 
@@ -0,0 +1,183 @@
+import sys
+from typing import List, Dict, Any, Tuple, Optional, Iterable, Mapping, Sequence
+
+import numpy as np
+
+ATTRIBUTE_KEYS = ["sweetness", "spiciness", "price", "distance", "rating"]
+
+# 近似得分与精确得分之间允许的误差，用于 top-k 选择时保留边界附近的候选
+_SELECTION_MARGIN = 1e-9
+
+
+class RankingEngine:
+    """
+    向量化的餐厅排序引擎。
+
+    构建时把所有餐厅的属性向量一次性放入一个 float64 矩阵，并预先归一化，
+    排序时用一次矩阵-向量乘法得到候选集的近似得分，再用 np.partition 做 top-k 部分选择，
+    最后只对被选中的少量行按 helper.cosine_similarity 的运算顺序重新计算精确得分，
+    因此返回的 (score, restaurant) 元组与逐行调用 cosine_similarity 的结果完全一致。
+    """
+
+    def __init__(self, all_restaurants: Sequence[Mapping[str, Any]], vectors: Optional[np.ndarray] = None,
+                 has_attributes: Optional[np.ndarray] = None, name_to_rows: Optional[Mapping[str, List[int]]] = None,
+                 int_mask: Optional[np.ndarray] = None, magnitudes: Optional[np.ndarray] = None,
+                 normalized: Optional[np.ndarray] = None, present_mask: Optional[np.ndarray] = None):
+        """
+        vectors、has_attributes、name_to_rows、int_mask 与 present_mask 可以由调用方预先给出（例如 compiled_catalog 中映射的列），
+        此时不再逐行读取 all_restaurants。int_mask 标记原始数据中为整数的属性值，为 None 时视为全部是浮点数；
+        present_mask 标记实际存在的属性（缺失的属性在 vectors 中为 0），为 None 时视为有 attributes 的餐厅五个属性都存在。
+        magnitudes 与 normalized 同样可以预先给出（需按本类相同的方式计算），否则在构建时计算。
+        """
+        self.restaurants = all_restaurants
+        if vectors is not None:
+            self.vectors = vectors
+            self.has_attributes = has_attributes
+            self.name_to_rows = name_to_rows
+            self.int_mask = int_mask
+            if present_mask is None:
+                present_mask = np.repeat(np.asarray(has_attributes, dtype=bool)[:, np.newaxis], len(ATTRIBUTE_KEYS), axis=1)
+            self.present_mask = present_mask
+        else:
+            self._build_from_records(all_restaurants)
+
+        if magnitudes is not None and normalized is not None:
+            self.magnitudes = magnitudes
+            self.normalized = normalized
+        else:
+            self.magnitudes, self.normalized = vector_norms(self.vectors, self.int_mask)
+
+    def _build_from_records(self, all_restaurants: Sequence[Mapping[str, Any]]):
+        count = len(all_restaurants)
+        self.vectors = np.zeros((count, len(ATTRIBUTE_KEYS)), dtype=np.float64)
+        self.has_attributes = np.zeros(count, dtype=bool)
+        self.int_mask: Optional[np.ndarray] = np.zeros((count, len(ATTRIBUTE_KEYS)), dtype=bool)
+        self.present_mask = np.zeros((count, len(ATTRIBUTE_KEYS)), dtype=bool)
+        self.name_to_rows: Dict[str, List[int]] = {}
+
+        for row, restaurant in enumerate(all_restaurants):
+            name = restaurant.get("name")
+            if name:
+                self.name_to_rows.setdefault(name, []).append(row)
+            attributes = restaurant.get("attributes")
+            if attributes:
+                self.has_attributes[row] = True
+                values = [attributes.get(key, 0.0) for key in ATTRIBUTE_KEYS]
+                self.vectors[row] = values
+                self.int_mask[row] = [_is_int(value) for value in values]
+                self.present_mask[row] = [key in attributes for key in ATTRIBUTE_KEYS]
+
+    def __len__(self) -> int:
+        return len(self.restaurants)
+
+    def rows_for_names(self, names: Iterable[str]) -> np.ndarray:
+        """将餐厅名字映射为矩阵中的行号，按目录中的原始顺序返回"""
+        batch_lookup = getattr(self.name_to_rows, "rows_for_names", None)
+        if batch_lookup is not None:
+            return batch_lookup(names)
+        rows: List[int] = []
+        for name in set(names):
+            rows.extend(self.name_to_rows.get(name, ()))
+        rows.sort()
+        return np.asarray(rows, dtype=np.intp)
+
+    def score_rows(self, rows: np.ndarray, preference_vector: List[float]) -> np.ndarray:
+        """
+        精确计算指定行与偏好向量的余弦相似度。
+        运算顺序与 helper.cosine_similarity 一致，结果逐位相同。
+        """
+        preference = np.asarray(preference_vector, dtype=np.float64)
+        preference_is_int = np.asarray([_is_int(value) for value in preference_vector], dtype=bool)
+        preference_magnitude = np.sqrt(_column_sum((preference * preference)[np.newaxis, :],
+                                                   preference_is_int[np.newaxis, :]))[0]
+        vectors = self.vectors[rows]
+        magnitudes = self.magnitudes[rows]
+
+        # 整数与整数的乘积仍是整数
+        product_is_int = self.int_mask[rows] & preference_is_int if self.int_mask is not None else None
+        dot_products = _column_sum(vectors * preference, product_is_int)
+        if preference_magnitude == 0:
+            return np.zeros(len(rows), dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            similarities = dot_products / (preference_magnitude * magnitudes)
+        similarities = np.clip(similarities, -1.0, 1.0)
+        similarities[magnitudes == 0] = 0.0
+        return similarities
+
+    def select_top_rows(self, rows: np.ndarray, preference_vector: List[float], top_k: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        从候选行中选出得分最高的 top_k 行，返回 (行号, 精确得分)，按得分降序排列，
+        得分相同时保持目录中的原始顺序（与 list.sort 的稳定排序一致）。
+        top_k 为 None 时返回全部候选行。
+        """
+        if top_k is not None and top_k < len(rows):
+            if top_k <= 0:
+                return rows[:0], np.zeros(0, dtype=np.float64)
+            preference = np.asarray(preference_vector, dtype=np.float64)
+            preference_norm = np.linalg.norm(preference)
+            if preference_norm > 0:
+                approximate = self.normalized[rows] @ (preference / preference_norm)
+                threshold = np.partition(approximate, len(rows) - top_k)[len(rows) - top_k]
+                rows = rows[approximate >= threshold - _SELECTION_MARGIN]
+
+        scores = self.score_rows(rows, preference_vector)
+        # lexsort 以最后一个键为主键：先按得分降序，再按行号升序
+        order = np.lexsort((rows, -scores))
+        if top_k is not None:
+            order = order[:top_k]
+        return rows[order], scores[order]
+
+    def rank(self, restaurant_names_to_rank: List[str], user_preference: Dict[str, float], top_k: Optional[int] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        根据用户画像对指定名字的餐厅排序，语义与 helper.perform_ranking 相同。
+        top_k 不为 None 时只返回得分最高的 top_k 家餐厅。
+        """
+        if not all(key in user_preference for key in ATTRIBUTE_KEYS):
+            sys.stderr.write("Error: User profile data is invalid (missing keys).\n")
+            return []
+
+        preference_vector = [user_preference.get(key, 0.5) for key in ATTRIBUTE_KEYS]
+        rows = self.rows_for_names(restaurant_names_to_rank)
+
+        for row in rows[~self.has_attributes[rows]]:
+            restaurant_name = self.restaurants[row].get("name")
+            sys.stderr.write(f"Warning: Restaurant '{restaurant_name}' has no 'attributes'. Giving default score 0.\n")
+
+        selected_rows, scores = self.select_top_rows(rows, preference_vector, top_k)
+        return [(float(score), self.restaurants[row]) for row, score in zip(selected_rows, scores)]
+
+
+def vector_norms(vectors: np.ndarray, int_mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """每行的模长与归一化后的向量，零向量归一化后仍为零向量"""
+    # 逐列累加平方和，保持与 cosine_similarity 中 sum() 相同的运算顺序
+    magnitudes = np.sqrt(_column_sum(vectors * vectors, int_mask))
+    safe_magnitudes = np.where(magnitudes == 0, 1.0, magnitudes)
+    return magnitudes, vectors / safe_magnitudes[:, np.newaxis]
+
+def _is_int(value: Any) -> bool:
+    return isinstance(value, int)
+
+def _column_sum(matrix: np.ndarray, is_int: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    按列从左到右累加每一行，等价于对每行的数值调用 sum()，is_int 标记哪些元素在 Python 中是 int。
+    Python 3.12 的 sum() 先精确累加开头的整数；遇到第一个浮点数时与整数部分直接相加，
+    之后浮点数使用 Neumaier 补偿求和，整数则不带补偿直接加到结果上，最后再加上补偿量。
+    这里逐列复现同样的步骤，保证浮点结果一致（属性值都是小整数，转换为 float64 没有误差）。
+    """
+    rows = matrix.shape[0]
+    total = np.zeros(rows, dtype=np.float64)
+    compensation = np.zeros(rows, dtype=np.float64)
+    # 到目前为止累加的都是整数
+    all_int = np.ones(rows, dtype=bool)
+    for column in range(matrix.shape[1]):
+        values = matrix[:, column]
+        column_is_int = is_int[:, column] if is_int is not None else np.zeros(rows, dtype=bool)
+        partial = total + values
+        compensated = ~(all_int | column_is_int)
+        error = np.where(np.abs(total) >= np.abs(values), (total - partial) + values, (values - partial) + total)
+        compensation += np.where(compensated, error, 0.0)
+        total = partial
+        all_int &= column_is_int
+    apply = (compensation != 0) & np.isfinite(compensation)
+    total[apply] += compensation[apply]
+    return total
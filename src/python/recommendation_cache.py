@@ -0,0 +1,173 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional, Set, Tuple
+
+import helper
+import config
+
+_STAT_KEYS = ("hits", "misses", "evictions")
+
+class RecommendationCache:
+    """
+    推荐词的磁盘缓存，带容量上限的 LRU 淘汰和过期时间。
+
+    缓存键由餐厅名字、量化后的用户画像向量和模型名组成，
+    画像只要落在同一个量化格子里就会命中，不必每次都请求 LLM。
+    文件中的条目按最近使用时间从旧到新排列，同时记录命中/未命中/淘汰次数。
+
+    查询只读内存，文件的 mtime 或大小变化（其他进程写入了新条目）时重新读取。
+    命中带来的 LRU 顺序变化和计数先记在内存中，写入新条目时（长期运行的进程中还包括计数积累超过
+    RECOMMENDATION_CACHE_STATS_FLUSH_SECONDS 秒后，或者调用 flush() 时）在 <缓存文件>.lock 的文件锁下
+    与文件的最新内容合并，写到同目录的临时文件后 os.replace，多个进程共用缓存时不会互相覆盖。
+    只命中缓存的一次性运行不会写文件，它的计数与 LRU 顺序不会保存，缓存命中的路径上没有整文件的写入。
+    """
+
+    def __init__(self, filepath: Optional[str] = None, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.filepath = filepath or config.RECOMMENDATION_CACHE_FILE
+        self.max_entries = max_entries or config.RECOMMENDATION_CACHE_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds or config.RECOMMENDATION_CACHE_TTL_SECONDS
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._file_signature: Optional[Tuple[int, int]] = None
+        self._file_stats: Dict[str, int] = dict.fromkeys(_STAT_KEYS, 0)
+        # 尚未写回文件的改动：计数增量、命中过的键（按命中顺序）、已过期删除的键
+        self._pending_stats: Dict[str, int] = dict.fromkeys(_STAT_KEYS, 0)
+        self._touched: List[str] = []
+        self._expired: Set[str] = set()
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """文件中记录的计数加上本进程尚未写回的增量"""
+        with self._lock:
+            return {key: self._file_stats.get(key, 0) + self._pending_stats[key] for key in _STAT_KEYS}
+
+    @staticmethod
+    def make_key(restaurant_name: str, user_profile: Dict[str, float], model: Optional[str]) -> str:
+        """生成缓存键：画像的每个维度按 RECOMMENDATION_CACHE_QUANTUM 四舍五入到格点"""
+        quantum = config.RECOMMENDATION_CACHE_QUANTUM
+        quantized = ",".join(
+            str(round(user_profile.get(key, 0.0) / quantum))
+            for key in helper.DEFAULT_USER_PROFILE.keys()
+        )
+        return f"{restaurant_name}|{quantized}|{model or ''}"
+
+    def _current_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.filepath)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _refresh(self):
+        """文件自上次读取或写入后发生了变化时重新读取，本进程未写回的改动保留在 _pending_stats 等字段中"""
+        signature = self._current_signature()
+        if signature == self._file_signature:
+            return
+        entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        stats = dict.fromkeys(_STAT_KEYS, 0)
+        data = helper.load_json_data(self.filepath) if signature is not None else None
+        if isinstance(data, dict):
+            stats.update(data.get("stats", {}))
+            for key, entry in data.get("entries", []):
+                entries[key] = entry
+        self._entries = entries
+        self._file_stats = stats
+        self._file_signature = signature
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        with open(self.filepath + ".lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self):
+        """把内存中的条目与计数原子地写入文件"""
+        data = {
+            "stats": self._file_stats,
+            "entries": [[key, entry] for key, entry in self._entries.items()],
+        }
+        directory = os.path.dirname(os.path.abspath(self.filepath))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.filepath) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=4)
+            os.replace(temp_path, self.filepath)
+        except OSError as e:
+            sys.stderr.write(f"Error occurred while saving recommendation cache to {self.filepath}: {e}\n")
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            return
+        self._file_signature = self._current_signature()
+
+    def _flush_locked(self, key: Optional[str] = None, text: Optional[str] = None):
+        """在文件锁下重新读取文件，合并本进程的改动（以及新条目 key/text）后写回。调用方持有 _lock"""
+        with self._file_lock():
+            self._refresh()
+            for expired_key in self._expired:
+                self._entries.pop(expired_key, None)
+            for touched_key in self._touched:
+                if touched_key in self._entries:
+                    self._entries.move_to_end(touched_key)
+            if key is not None:
+                self._entries[key] = {"text": text, "created_at": time.time()}
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._pending_stats["evictions"] += 1
+            for stat_key in _STAT_KEYS:
+                self._file_stats[stat_key] = self._file_stats.get(stat_key, 0) + self._pending_stats[stat_key]
+            self._write()
+        self._pending_stats = dict.fromkeys(_STAT_KEYS, 0)
+        self._touched = []
+        self._expired = set()
+        self._last_flush = time.monotonic()
+
+    def _has_pending_changes(self) -> bool:
+        return bool(self._touched or self._expired or any(self._pending_stats.values()))
+
+    def get(self, key: str) -> Optional[str]:
+        """查找缓存的推荐词，过期的条目视为未命中并被删除"""
+        with self._lock:
+            self._refresh()
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry["created_at"] > self.ttl_seconds:
+                del self._entries[key]
+                self._expired.add(key)
+                entry = None
+
+            if entry is None:
+                self._pending_stats["misses"] += 1
+            else:
+                self._entries.move_to_end(key)
+                self._touched.append(key)
+                self._pending_stats["hits"] += 1
+
+            if time.monotonic() - self._last_flush > config.RECOMMENDATION_CACHE_STATS_FLUSH_SECONDS:
+                self._flush_locked()
+            return entry["text"] if entry is not None else None
+
+    def put(self, key: str, text: str):
+        """写入推荐词，超过容量时淘汰最久未使用的条目"""
+        if not text:
+            return
+        with self._lock:
+            self._flush_locked(key, text)
+
+    def flush(self):
+        """把尚未写回的计数与 LRU 顺序合并到文件，供长期运行的进程在退出前调用"""
+        with self._lock:
+            if self._has_pending_changes():
+                self._flush_locked()
@@ -0,0 +1,357 @@
+"""
+常驻的排序与推荐服务。
+
+ranker.py 每次查询都要启动新的 Python 进程、加载目录、建立 MCP 连接和 LLM 客户端；
+本服务只在启动时做一次这些工作，所有请求共享同一份目录与索引、同一个用户存储、
+同一个 MCP 会话和同一个 LLM 连接池。同时处理的请求数由 config.SERVICE_MAX_CONCURRENCY 限制，
+排队的请求超过 config.SERVICE_MAX_PENDING 时立即返回 busy，而不是无限制地堆积。
+收到 SIGINT/SIGTERM 后停止接受新连接与新请求，等待已接受的请求（包括排队中的）完成
+（最多 SERVICE_SHUTDOWN_TIMEOUT_SECONDS 秒）再退出。
+
+Unix 套接字协议：每行一个 JSON 请求，每行一个 JSON 响应，同一连接上的请求按顺序处理。
+    {"type": "rank", "id": "q1", "user": "alice", "names": "川味小厨,猪肉荣", "keywords": "麻辣",
+     "filter": "cheap", "top_k": 5, "llm": true}
+    -> {"id": "q1", "ok": true, "ranked": [{"name": ..., "score": ...}, ...], "count": 2,
+        "recommendation": "...", "text": "..."}
+    {"type": "order", "choice": 1}      # 本连接上一次排序结果中的第几家（从 1 开始），也可以给出 "restaurant": 名字
+    -> {"ok": true, "restaurant": ..., "order_date": ..., "message": ...}
+    {"type": "ping"}                    -> {"ok": true}
+names 可以是列表或逗号分隔的字符串，除 type 以外的字段都是可选的，含义与 ranker.py 的同名参数相同；
+text 是与 ranker.py 相同格式的排序结果加上推荐词，供 C++ 端直接显示。
+出错时返回 {"id": ..., "ok": false, "error": "..."}，排队请求过多时 error 为 "busy"，正在关闭时为 "shutting down"。
+
+HTTP (--http HOST:PORT)：POST /rank 与 POST /order 的请求体与响应体同上（order 需要给出 restaurant），
+GET /health 返回 {"ok": true}；busy 与 shutting down 对应 503，其他错误对应 400。
+
+用法：
+    python service.py [--socket PATH] [--http 127.0.0.1:8765] [--no-llm] [--trace]
+"""
+import os
+import sys
+import json
+import signal
+import socket
+import asyncio
+import argparse
+from typing import List, Dict, Any, Tuple, Optional, Set
+
+import config
+import catalog
+import tracing
+import history_log
+import ranker
+from recommendation_cache import RecommendationCache
+
+_HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+class AgentService:
+    def __init__(self, use_llm: bool = True):
+        self.use_llm = use_llm
+        self.client = None
+        self.recommendation_cache = RecommendationCache()
+        self._semaphore = asyncio.Semaphore(config.SERVICE_MAX_CONCURRENCY)
+        # 下单会读-改-写默认用户的画像文件，串行执行
+        self._order_lock = asyncio.Lock()
+        self._pending = 0
+        self._closing = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._connection_tasks: Set[asyncio.Task] = set()
+        self._servers: List[asyncio.AbstractServer] = []
+
+    async def start(self, socket_path: Optional[str], http_address: Optional[Tuple[str, int]]):
+        """加载目录与索引，连接 MCP 服务，开始监听"""
+        loop = asyncio.get_running_loop()
+        restaurant_catalog = await loop.run_in_executor(None, catalog.get_catalog)
+        if restaurant_catalog.engine is None:
+            raise RuntimeError("Failed to load valid restaurant data.")
+
+        if self.use_llm:
+            ranker.load_environment()
+            mcp_client = ranker.load_llm_stack()
+            self.client = mcp_client.MCPClient()
+            await self.client.connect_to_server()
+
+        if socket_path:
+            _remove_stale_socket(socket_path)
+            server = await asyncio.start_unix_server(self._serve_lines, path=socket_path,
+                                                     limit=config.SERVICE_MAX_LINE_BYTES,
+                                                     backlog=config.SERVICE_MAX_PENDING)
+            os.chmod(socket_path, 0o600)
+            self._servers.append(server)
+            print(f"Listening on unix socket {socket_path}", file=sys.stderr)
+        if http_address:
+            server = await asyncio.start_server(self._serve_http, http_address[0], http_address[1],
+                                                limit=config.SERVICE_MAX_LINE_BYTES,
+                                                backlog=config.SERVICE_MAX_PENDING)
+            self._servers.append(server)
+            print(f"Listening on http://{http_address[0]}:{http_address[1]}", file=sys.stderr)
+
+    async def shutdown(self, socket_path: Optional[str]):
+        """停止接受新连接，等待进行中的请求完成后关闭空闲连接与 MCP 会话"""
+        self._closing = True
+        for server in self._servers:
+            server.close()
+        try:
+            await asyncio.wait_for(self._idle.wait(), config.SERVICE_SHUTDOWN_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            sys.stderr.write(f"Warning: {self._pending} requests still running after "
+                             f"{config.SERVICE_SHUTDOWN_TIMEOUT_SECONDS}s, cancelling them.\n")
+        for task in list(self._connection_tasks):
+            task.cancel()
+        await asyncio.gather(*self._connection_tasks, return_exceptions=True)
+        for server in self._servers:
+            await server.wait_closed()
+        if self.client is not None:
+            await self.client.cleanup()
+        await asyncio.get_running_loop().run_in_executor(None, self.recommendation_cache.flush)
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+    async def handle(self, request: Dict[str, Any], session: Dict[str, Any]) -> Dict[str, Any]:
+        """处理一个请求，返回响应。session 保存同一连接上的状态（上一次的排序结果）"""
+        if not isinstance(request, dict):
+            return {"ok": False, "error": "Request must be a JSON object."}
+        request_type = request.get("type", "rank")
+        if request_type == "ping":
+            return {"id": request.get("id"), "ok": True}
+        if request_type not in ("rank", "order"):
+            return {"id": request.get("id"), "ok": False, "error": f"Unknown request type: {request_type}"}
+
+        if self._closing:
+            return {"id": request.get("id"), "ok": False, "error": "shutting down"}
+        # 已接受（正在处理或排队等待）的请求过多时立即拒绝，由客户端决定重试
+        if self._pending >= config.SERVICE_MAX_PENDING:
+            return {"id": request.get("id"), "ok": False, "error": "busy"}
+        self._pending += 1
+        self._idle.clear()
+        try:
+            async with self._semaphore:
+                with tracing.span(f"service_request:{request_type}"):
+                    if request_type == "rank":
+                        return await self._rank(request, session)
+                    return await self._order(request, session)
+        except Exception as e:
+            sys.stderr.write(f"Error occurred while handling {request_type} request: {e}\n")
+            return {"id": request.get("id"), "ok": False, "error": str(e)}
+        finally:
+            self._pending -= 1
+            if self._pending == 0:
+                self._idle.set()
+
+    async def _rank(self, request: Dict[str, Any], session: Dict[str, Any]) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        ranked_results, user_profile_data = await loop.run_in_executor(None, ranker.rank_request, request)
+        session["ranked"] = ranked_results
+        session["user"] = request.get("user")
+
+        response: Dict[str, Any] = {
+            "id": request.get("id"),
+            "ok": True,
+            "ranked": [{"name": restaurant.get("name"), "score": score} for score, restaurant in ranked_results],
+            "count": len(ranked_results),
+            "recommendation": None,
+        }
+        text = ranker.format_ranked_results(ranked_results) if ranked_results else "\nNo restaurants found matching your criteria.\n"
+        if ranked_results and self.client is not None and request.get("llm", True):
+            try:
+                response["recommendation"] = await self._recommend(ranked_results[0][1], user_profile_data,
+                                                                  request.get("user"))
+                text += "\n" + (response["recommendation"] or "") + "\n"
+            except Exception as e:
+                sys.stderr.write(f"Error occurred while generating the recommendation: {e}\n")
+                response["llm_error"] = str(e)
+        response["text"] = text
+        return response
+
+    async def _recommend(self, restaurant: Dict[str, Any], user_profile_data: Dict[str, float],
+                         user_id: Optional[str]) -> Optional[str]:
+        """为排名第一的餐厅生成推荐词，优先使用推荐词缓存，未命中时预取工具结果后请求 LLM"""
+        query = restaurant.get("name")
+        loop = asyncio.get_running_loop()
+        cache_key = self.recommendation_cache.make_key(query, user_profile_data, os.getenv("OPENAI_MODEL"))
+        # 缓存可能读写文件，放到线程池中，不阻塞事件循环
+        cached_response = await loop.run_in_executor(None, self.recommendation_cache.get, cache_key)
+        if cached_response is not None:
+            return cached_response
+
+        tool_results = None
+        if config.PREFETCH_TOOL_RESULTS:
+            tool_results = await loop.run_in_executor(None, ranker.prefetch_tool_results, restaurant, user_profile_data)
+        response = await self.client.process_query(query, tool_results=tool_results, user_id=user_id)
+        await loop.run_in_executor(None, self.recommendation_cache.put, cache_key, response)
+        return response
+
+    async def _order(self, request: Dict[str, Any], session: Dict[str, Any]) -> Dict[str, Any]:
+        restaurant_catalog = catalog.get_catalog()
+        user_id = request.get("user", session.get("user"))
+        restaurant = None
+        if request.get("restaurant"):
+            restaurant = restaurant_catalog.find(request["restaurant"])
+            if restaurant is None:
+                return {"id": request.get("id"), "ok": False, "error": f"Unknown restaurant: {request['restaurant']}"}
+        else:
+            ranked_results = session.get("ranked") or []
+            choice = request.get("choice")
+            if not isinstance(choice, int) or not 1 <= choice <= len(ranked_results):
+                return {"id": request.get("id"), "ok": False,
+                        "error": f"Invalid choice: expected a number between 1 and {len(ranked_results)}"}
+            restaurant = ranked_results[choice - 1][1]
+
+        async with self._order_lock:
+            order_date = await asyncio.get_running_loop().run_in_executor(
+                None, ranker.place_order, restaurant, restaurant_catalog.restaurants, user_id)
+        history_log.compact_in_background_if_needed()
+        name = restaurant.get("name", "Unknown")
+        return {
+            "id": request.get("id"),
+            "ok": True,
+            "restaurant": name,
+            "order_date": order_date,
+            "message": f"Order placed successfully! Your order for {name} has been recorded in history.",
+        }
+
+    async def _serve_lines(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Unix 套接字连接：逐行读取请求，处理完一个再读下一个，客户端发送过快时由套接字缓冲区形成背压"""
+        self._connection_tasks.add(asyncio.current_task())
+        session: Dict[str, Any] = {}
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # 超过 SERVICE_MAX_LINE_BYTES 的请求行，无法再与后续请求对齐，关闭连接
+                    await _write_line(writer, {"ok": False, "error": "Request line too long."})
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError as e:
+                    response = {"ok": False, "error": f"Invalid JSON: {e}"}
+                else:
+                    response = await self.handle(request, session)
+                await _write_line(writer, response)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connection_tasks.discard(asyncio.current_task())
+            writer.close()
+
+    async def _serve_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """最小的 HTTP/1.1 处理：每个连接一个请求，响应后关闭连接"""
+        self._connection_tasks.add(asyncio.current_task())
+        try:
+            status, response = await self._http_request(reader)
+            body = json.dumps(response, ensure_ascii=False).encode("utf-8")
+            writer.write(f"HTTP/1.1 {status} {_HTTP_REASONS[status]}\r\n"
+                         f"Content-Type: application/json; charset=utf-8\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii") + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connection_tasks.discard(asyncio.current_task())
+            writer.close()
+
+    async def _http_request(self, reader: asyncio.StreamReader) -> Tuple[int, Dict[str, Any]]:
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers: Dict[str, str] = {}
+            while True:
+                header = (await reader.readline()).decode("latin-1").strip()
+                if not header:
+                    break
+                key, _, value = header.partition(":")
+                headers[key.strip().lower()] = value.strip()
+        except ValueError:
+            return 413, {"ok": False, "error": "Request header too long."}
+        if len(request_line) < 2:
+            return 400, {"ok": False, "error": "Malformed HTTP request."}
+        method, path = request_line[0], request_line[1]
+
+        if method == "GET" and path == "/health":
+            return 200, {"ok": True}
+        if method != "POST" or path not in ("/rank", "/order"):
+            return 404, {"ok": False, "error": f"Unknown endpoint: {method} {path}"}
+
+        try:
+            length = int(headers.get("content-length", "0") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            return 400, {"ok": False, "error": "Invalid Content-Length header."}
+        if length > config.SERVICE_MAX_LINE_BYTES:
+            return 413, {"ok": False, "error": "Request body too large."}
+        try:
+            request = json.loads(await reader.readexactly(length)) if length else {}
+        except json.JSONDecodeError as e:
+            return 400, {"ok": False, "error": f"Invalid JSON: {e}"}
+        if not isinstance(request, dict):
+            return 400, {"ok": False, "error": "Request must be a JSON object."}
+        request["type"] = path[1:]
+        response = await self.handle(request, {})
+        if response.get("ok"):
+            return 200, response
+        return (503 if response.get("error") in ("busy", "shutting down") else 400), response
+
+
+async def _write_line(writer: asyncio.StreamWriter, response: Dict[str, Any]):
+    writer.write((json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8"))
+    await writer.drain()
+
+def _remove_stale_socket(socket_path: str):
+    """删除上一次异常退出留下的套接字文件；已有服务在监听时报错退出"""
+    if not os.path.exists(socket_path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except OSError:
+        os.remove(socket_path)
+    else:
+        raise RuntimeError(f"Another service is already listening on {socket_path}")
+    finally:
+        probe.close()
+
+def parse_http_address(address: str) -> Tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+async def serve(socket_path: Optional[str], http_address: Optional[Tuple[str, int]], use_llm: bool):
+    service = AgentService(use_llm)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    await service.start(socket_path, http_address)
+    await stop.wait()
+    print("Shutting down, waiting for running requests ...", file=sys.stderr)
+    await service.shutdown(socket_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Long-running rank-and-recommend service.")
+    parser.add_argument("--socket", default=config.SERVICE_SOCKET_PATH,
+                        help="unix socket path for the line-delimited JSON protocol ('' to disable)")
+    parser.add_argument("--http", default=None, help="also serve HTTP on HOST:PORT, e.g. 127.0.0.1:8765")
+    parser.add_argument("--no-llm", action="store_true", help="only rank, never connect to MCP or request the LLM")
+    parser.add_argument("--trace", action="store_true",
+                        help="record per-stage latencies to the trace file (summarize with tracing.py)")
+    args = parser.parse_args()
+    if args.trace:
+        tracing.enable()
+    if not args.socket and not args.http:
+        parser.error("nothing to listen on: give --socket or --http")
+
+    try:
+        asyncio.run(serve(args.socket or None, parse_http_address(args.http) if args.http else None, not args.no_llm))
+    except RuntimeError as e:
+        sys.stderr.write(f"{e} Exiting.\n")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+轻量的分阶段耗时追踪。
+
+    with tracing.span("llm_completion"):
+        ...
+
+关闭时 span() 返回一个共享的空上下文管理器，几乎没有开销；
+开启时（config.TRACE_ENABLED、环境变量 AGENT_TRACE=1 或调用 enable()）每个阶段的耗时先记录在内存中，
+积累到 TRACE_EXPORT_BATCH_SIZE 条、距上次导出超过 TRACE_EXPORT_INTERVAL_SECONDS 秒或进程退出时
+以 JSON Lines 追加到 config.TRACE_FILE 并从内存中移除，便于跨多次运行统计 p50/p95/p99，
+长期运行的服务占用的内存也不会随请求数增长。
+
+用法：
+    python tracing.py            # 汇总 TRACE_FILE 中所有记录的分阶段耗时
+    python tracing.py --clear    # 清空 TRACE_FILE
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import argparse
+import threading
+from typing import List, Dict, Any, Iterable, Optional
+
+import helper
+import config
+
+_enabled = config.TRACE_ENABLED or os.environ.get("AGENT_TRACE") == "1"
+# 尚未导出的阶段
+_spans: List[Dict[str, Any]] = []
+_spans_lock = threading.Lock()
+# 导出期间持有，保证读取追踪文件的一方不会漏掉正在写入的阶段
+_export_lock = threading.Lock()
+_last_export = time.monotonic()
+
+
+class _NullSpan:
+    """追踪关闭时使用的空上下文管理器"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record(self.name, time.perf_counter() - self.start, error=exc_type is not None)
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+def enable():
+    """在运行时开启追踪"""
+    global _enabled
+    _enabled = True
+
+def is_enabled() -> bool:
+    return _enabled
+
+def span(name: str):
+    """返回记录一个阶段耗时的上下文管理器，同步和异步代码中都可以使用"""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name)
+
+def record(name: str, duration_s: float, error: bool = False):
+    """直接记录一个阶段的耗时"""
+    if not _enabled:
+        return
+    entry = {"stage": name, "duration_s": duration_s, "ts": time.time(), "pid": os.getpid()}
+    if error:
+        entry["error"] = True
+    with _spans_lock:
+        _spans.append(entry)
+        export_due = (len(_spans) >= config.TRACE_EXPORT_BATCH_SIZE
+                      or time.monotonic() - _last_export >= config.TRACE_EXPORT_INTERVAL_SECONDS)
+    if export_due:
+        export()
+
+def recorded_spans() -> List[Dict[str, Any]]:
+    """当前进程中记录的、尚未导出到追踪文件的阶段"""
+    with _spans_lock:
+        return list(_spans)
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+def summarize(spans: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """按阶段汇总耗时：次数、平均值与 p50/p95/p99/最大值（毫秒）"""
+    durations: Dict[str, List[float]] = {}
+    for entry in spans:
+        durations.setdefault(entry["stage"], []).append(entry["duration_s"])
+
+    summary: Dict[str, Dict[str, float]] = {}
+    for stage, values in durations.items():
+        values.sort()
+        summary[stage] = {
+            "count": len(values),
+            "mean_ms": sum(values) / len(values) * 1000,
+            "p50_ms": _percentile(values, 0.50) * 1000,
+            "p95_ms": _percentile(values, 0.95) * 1000,
+            "p99_ms": _percentile(values, 0.99) * 1000,
+            "max_ms": values[-1] * 1000,
+        }
+    return summary
+
+def export(filepath: Optional[str] = None):
+    """把尚未导出的阶段追加到追踪文件，并从内存中移除"""
+    global _spans, _last_export
+    filepath = filepath or config.TRACE_FILE
+    with _export_lock:
+        with _spans_lock:
+            pending = _spans
+            _spans = []
+            _last_export = time.monotonic()
+        if not pending:
+            return
+        try:
+            with open(filepath, 'a', encoding='utf-8') as f:
+                f.write("".join(json.dumps(entry) + "\n" for entry in pending))
+        except Exception as e:
+            sys.stderr.write(f"Error occurred while exporting trace spans to {filepath}: {e}\n")
+
+def load_spans(filepath: Optional[str] = None) -> List[Dict[str, Any]]:
+    """读取追踪文件中的所有阶段记录"""
+    return list(helper.iter_json_records(filepath or config.TRACE_FILE))
+
+def all_spans(filepath: Optional[str] = None) -> List[Dict[str, Any]]:
+    """追踪文件中的记录加上当前进程中尚未导出的记录"""
+    with _export_lock:
+        with _spans_lock:
+            pending = list(_spans)
+        return load_spans(filepath) + pending
+
+def format_summary(summary: Dict[str, Dict[str, float]]) -> str:
+    lines = [f"{'stage':<32}{'count':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)"]
+    for stage, stats in sorted(summary.items(), key=lambda item: -item[1]["mean_ms"] * item[1]["count"]):
+        lines.append(f"{stage:<32}{stats['count']:>8}{stats['mean_ms']:>10.2f}{stats['p50_ms']:>10.2f}"
+                     f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['max_ms']:>10.2f}")
+    return "\n".join(lines)
+
+atexit.register(export)
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize per-stage latency traces.")
+    parser.add_argument("--file", default=None, help=f"trace file (default: {config.TRACE_FILE})")
+    parser.add_argument("--clear", action="store_true", help="delete the trace file")
+    args = parser.parse_args()
+
+    filepath = args.file or config.TRACE_FILE
+    if args.clear:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        return
+    print(format_summary(summarize(load_spans(filepath))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+多用户的画像与订单历史存储 (SQLite)。
+
+数据库使用 WAL 模式：读者不会阻塞写者，多个进程可以同时读写；
+写事务以 BEGIN IMMEDIATE 开始，同一用户画像的读-改-写在一个事务内完成，并发下单不会互相覆盖。
+    profiles(user_id PRIMARY KEY, profile, state, updated_at)   画像与增量状态 (JSON)
+    orders(id, user_id, restaurant_name, order_date, weight, count)  订单，按 (user_id, order_date) 建索引
+按用户 id 读取画像是主键上的点查，读取一个用户的历史只扫描该用户的索引区间。
+
+config.STORAGE_BACKEND 为 "json" 时默认用户仍使用 user_profile.json 与 history.jsonl，
+其他用户存放在本数据库中；为 "sqlite" 时所有用户（包括默认用户）都存放在本数据库中。
+
+用法：
+    python user_store.py import-json [--user ID]   # 把 JSON 文件中的画像与历史导入数据库
+    python user_store.py users                     # 列出数据库中的用户与订单数
+"""
+import os
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
+
+import config
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    user_id TEXT PRIMARY KEY,
+    profile TEXT NOT NULL,
+    state TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    restaurant_name TEXT NOT NULL,
+    order_date TEXT NOT NULL,
+    weight REAL NOT NULL DEFAULT 1.0,
+    count INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS orders_user_date ON orders (user_id, order_date);
+"""
+
+def resolve_user_id(user_id: Optional[str]) -> str:
+    """未指定用户时使用默认用户"""
+    return user_id or config.DEFAULT_USER_ID
+
+def uses_json_files(user_id: Optional[str]) -> bool:
+    """该用户的画像与历史是否存放在 JSON 文件中（而不是数据库中）"""
+    return config.STORAGE_BACKEND == "json" and resolve_user_id(user_id) == config.DEFAULT_USER_ID
+
+
+class UserStore:
+    """
+    SQLite 用户存储。每个线程（以及 fork 出的每个进程）使用各自的连接，
+    连接处于自动提交模式，批量写入通过 transaction() 合并为一个事务。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=config.USER_DB_BUSY_TIMEOUT_SECONDS, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL") # 与历史日志一致：事务提交返回前已落盘
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.depth = 0
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    self._schema_ready = True
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """写事务，可以嵌套（内层并入外层事务）。异常时回滚"""
+        conn = self._connection()
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.depth = 1
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            self._local.depth = 0
+
+    def load_profile(self, user_id: str) -> Optional[Dict[str, float]]:
+        """读取一个用户的画像，用户不存在时返回 None"""
+        row = self._connection().execute("SELECT profile FROM profiles WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def load_profiles(self, user_ids: Iterable[str]) -> Dict[str, Dict[str, float]]:
+        """一次查询读取多个用户的画像，不存在的用户不出现在结果中"""
+        unique_ids = list(dict.fromkeys(user_ids))
+        profiles: Dict[str, Dict[str, float]] = {}
+        conn = self._connection()
+        # SQLite 对单条语句的参数个数有限制，分块查询
+        for start in range(0, len(unique_ids), 500):
+            chunk = unique_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for user_id, profile in conn.execute(f"SELECT user_id, profile FROM profiles WHERE user_id IN ({placeholders})", chunk):
+                profiles[user_id] = json.loads(profile)
+        return profiles
+
+    def load_state(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """读取一个用户的画像增量状态，没有时返回 None"""
+        row = self._connection().execute("SELECT state FROM profiles WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def save_profile(self, user_id: str, profile: Dict[str, float], state: Optional[Dict[str, Any]] = None):
+        """保存一个用户的画像（以及可选的增量状态）"""
+        self.save_profiles({user_id: (profile, state)})
+
+    def save_profiles(self, entries: Dict[str, Tuple[Dict[str, float], Optional[Dict[str, Any]]]]):
+        """在一个事务中批量保存多个用户的 (画像, 增量状态)"""
+        now = time.time()
+        rows = [
+            (user_id, json.dumps(profile), json.dumps(state) if state is not None else None, now)
+            for user_id, (profile, state) in entries.items()
+        ]
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO profiles (user_id, profile, state, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET profile = excluded.profile, "
+                "state = COALESCE(excluded.state, profiles.state), updated_at = excluded.updated_at",
+                rows)
+
+    def append_orders(self, orders: Iterable[Tuple[str, Dict[str, Any]]]):
+        """在一个事务中批量追加 (用户 id, 订单记录)"""
+        rows = (
+            (user_id, record["restaurant_name"], record["order_date"], record.get("weight", 1.0), record.get("count", 1))
+            for user_id, record in orders
+        )
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO orders (user_id, restaurant_name, order_date, weight, count) VALUES (?, ?, ?, ?, ?)", rows)
+
+    def iter_orders(self, user_id: str) -> Iterator[Dict[str, Any]]:
+        """按写入顺序逐条读取一个用户的订单（包括聚合记录）"""
+        cursor = self._connection().execute(
+            "SELECT restaurant_name, order_date, weight, count FROM orders WHERE user_id = ? ORDER BY id", (user_id,))
+        for restaurant_name, order_date, weight, count in cursor:
+            record: Dict[str, Any] = {"restaurant_name": restaurant_name, "order_date": order_date}
+            if weight != 1.0 or count != 1:
+                record["weight"] = weight
+                record["count"] = count
+            yield record
+
+    def list_users(self) -> List[Tuple[str, int]]:
+        """所有用户及其订单数"""
+        return self._connection().execute(
+            "SELECT user_id, COUNT(orders.id) FROM profiles LEFT JOIN orders USING (user_id) "
+            "GROUP BY user_id UNION "
+            "SELECT user_id, COUNT(*) FROM orders WHERE user_id NOT IN (SELECT user_id FROM profiles) "
+            "GROUP BY user_id ORDER BY user_id").fetchall()
+
+
+_stores: Dict[str, UserStore] = {}
+_stores_lock = threading.Lock()
+
+def get_store(db_path: Optional[str] = None) -> UserStore:
+    """返回进程内共享的用户存储，默认对应 config.USER_DB_FILE"""
+    db_path = db_path or config.USER_DB_FILE
+    with _stores_lock:
+        if db_path not in _stores:
+            _stores[db_path] = UserStore(db_path)
+        return _stores[db_path]
+
+def import_json_files(user_id: str) -> int:
+    """把 JSON 文件中的画像、增量状态与历史导入数据库中的 user_id 用户，返回导入的订单数"""
+    import helper
+    import history_log
+
+    store = get_store()
+    imported = 0
+    with store.transaction():
+        batch: List[Tuple[str, Dict[str, Any]]] = []
+        # 直接读取 JSON 文件，不经过 STORAGE_BACKEND 的路由
+        history_log.migrate_legacy_history()
+        for record in helper.iter_json_records(config.HISTORY_FILE):
+            if not record.get("restaurant_name") or not record.get("order_date"):
+                continue
+            batch.append((user_id, record))
+            if len(batch) >= 10000:
+                store.append_orders(batch)
+                imported += len(batch)
+                batch = []
+        store.append_orders(batch)
+        imported += len(batch)
+
+        profile = helper.load_json_data(config.USER_PROFILE_FILE) if os.path.exists(config.USER_PROFILE_FILE) else None
+        state = helper.load_json_data(config.PROFILE_STATE_FILE) if os.path.exists(config.PROFILE_STATE_FILE) else None
+        store.save_profile(user_id, profile or helper.DEFAULT_USER_PROFILE.copy(), state)
+    return imported
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the multi-user SQLite profile and history store.")
+    parser.add_argument("command", choices=["import-json", "users"])
+    parser.add_argument("--user", default=config.DEFAULT_USER_ID, help="user id to import the JSON files into")
+    args = parser.parse_args()
+
+    if args.command == "import-json":
+        imported = import_json_files(args.user)
+        print(f"Imported {imported} history records for user '{args.user}' into {config.USER_DB_FILE}")
+        return
+    for user_id, order_count in get_store().list_users():
+        print(f"{user_id}\t{order_count}")
+
+if __name__ == "__main__":
+    main()
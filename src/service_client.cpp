@@ -0,0 +1,174 @@
+#include "service_client.h"
+#include <cstdio>
+#include <cstring>
+#include <cstdlib>
+#include <cerrno>
+#include <sys/socket.h>
+#include <sys/un.h>
+#include <unistd.h>
+
+ServiceClient::ServiceClient(const std::string& socket_path) : fd_(-1) {
+    sockaddr_un address{};
+    if (socket_path.size() >= sizeof(address.sun_path)) {
+        throw ServiceError("Socket path too long: " + socket_path);
+    }
+    address.sun_family = AF_UNIX;
+    std::strncpy(address.sun_path, socket_path.c_str(), sizeof(address.sun_path) - 1);
+
+    fd_ = socket(AF_UNIX, SOCK_STREAM, 0);
+    if (fd_ < 0) {
+        throw ServiceError(std::string("Failed to create socket: ") + std::strerror(errno));
+    }
+    if (connect(fd_, reinterpret_cast<sockaddr*>(&address), sizeof(address)) < 0) {
+        std::string reason = std::strerror(errno);
+        close(fd_);
+        fd_ = -1;
+        throw ServiceError("Failed to connect to " + socket_path + ": " + reason);
+    }
+}
+
+ServiceClient::~ServiceClient() {
+    if (fd_ >= 0) {
+        close(fd_);
+    }
+}
+
+std::string ServiceClient::request(const std::string& json_line) {
+    // 发送一行请求，MSG_NOSIGNAL 避免服务端关闭连接时进程被 SIGPIPE 终止
+    std::string line = json_line + "\n";
+    size_t sent = 0;
+    while (sent < line.size()) {
+        ssize_t n = send(fd_, line.data() + sent, line.size() - sent, MSG_NOSIGNAL);
+        if (n < 0) {
+            if (errno == EINTR) continue;
+            throw ServiceError(std::string("Failed to send request: ") + std::strerror(errno));
+        }
+        sent += static_cast<size_t>(n);
+    }
+
+    // 读取到换行为止，即一条完整的响应
+    size_t newline;
+    while ((newline = buffer_.find('\n')) == std::string::npos) {
+        char chunk[4096];
+        ssize_t n = recv(fd_, chunk, sizeof(chunk), 0);
+        if (n < 0) {
+            if (errno == EINTR) continue;
+            throw ServiceError(std::string("Failed to read response: ") + std::strerror(errno));
+        }
+        if (n == 0) {
+            throw ServiceError("Service closed the connection.");
+        }
+        buffer_.append(chunk, static_cast<size_t>(n));
+    }
+    std::string response = buffer_.substr(0, newline);
+    buffer_.erase(0, newline + 1);
+    return response;
+}
+
+std::string ServiceClient::escapeJson(const std::string& value) {
+    std::string escaped;
+    escaped.reserve(value.size() + 2);
+    for (unsigned char c : value) {
+        switch (c) {
+            case '"': escaped += "\\\""; break;
+            case '\\': escaped += "\\\\"; break;
+            case '\n': escaped += "\\n"; break;
+            case '\r': escaped += "\\r"; break;
+            case '\t': escaped += "\\t"; break;
+            default:
+                if (c < 0x20) {
+                    char unicode[8];
+                    std::snprintf(unicode, sizeof(unicode), "\\u%04x", c);
+                    escaped += unicode;
+                } else {
+                    escaped += static_cast<char>(c);
+                }
+        }
+    }
+    return escaped;
+}
+
+// 服务端以 json.dumps 的默认格式输出，顶层字段形如 "key": value；
+// 字符串值中的引号都被转义，因此 "key": 不会在字符串值内部出现
+size_t ServiceClient::findValue(const std::string& json, const std::string& key) {
+    std::string pattern = "\"" + key + "\": ";
+    size_t position = json.find(pattern);
+    if (position == std::string::npos) {
+        return std::string::npos;
+    }
+    return position + pattern.size();
+}
+
+static void appendUtf8(std::string& out, unsigned long code_point) {
+    if (code_point < 0x80) {
+        out += static_cast<char>(code_point);
+    } else if (code_point < 0x800) {
+        out += static_cast<char>(0xC0 | (code_point >> 6));
+        out += static_cast<char>(0x80 | (code_point & 0x3F));
+    } else if (code_point < 0x10000) {
+        out += static_cast<char>(0xE0 | (code_point >> 12));
+        out += static_cast<char>(0x80 | ((code_point >> 6) & 0x3F));
+        out += static_cast<char>(0x80 | (code_point & 0x3F));
+    } else {
+        out += static_cast<char>(0xF0 | (code_point >> 18));
+        out += static_cast<char>(0x80 | ((code_point >> 12) & 0x3F));
+        out += static_cast<char>(0x80 | ((code_point >> 6) & 0x3F));
+        out += static_cast<char>(0x80 | (code_point & 0x3F));
+    }
+}
+
+std::string ServiceClient::getString(const std::string& json, const std::string& key) {
+    size_t position = findValue(json, key);
+    if (position == std::string::npos || position >= json.size() || json[position] != '"') {
+        return "";  // 字段不存在或者为 null
+    }
+    std::string value;
+    for (size_t i = position + 1; i < json.size(); ++i) {
+        char c = json[i];
+        if (c == '"') {
+            break;
+        }
+        if (c != '\\' || i + 1 >= json.size()) {
+            value += c;
+            continue;
+        }
+        char escape = json[++i];
+        switch (escape) {
+            case 'n': value += '\n'; break;
+            case 'r': value += '\r'; break;
+            case 't': value += '\t'; break;
+            case 'b': value += '\b'; break;
+            case 'f': value += '\f'; break;
+            case 'u': {
+                if (i + 4 >= json.size()) break;
+                unsigned long code_point = std::strtoul(json.substr(i + 1, 4).c_str(), nullptr, 16);
+                i += 4;
+                // 代理对
+                if (code_point >= 0xD800 && code_point < 0xDC00 && i + 6 < json.size() && json[i + 1] == '\\' && json[i + 2] == 'u') {
+                    unsigned long low = std::strtoul(json.substr(i + 3, 4).c_str(), nullptr, 16);
+                    code_point = 0x10000 + ((code_point - 0xD800) << 10) + (low - 0xDC00);
+                    i += 6;
+                }
+                appendUtf8(value, code_point);
+                break;
+            }
+            default: value += escape; break;
+        }
+    }
+    return value;
+}
+
+long ServiceClient::getInt(const std::string& json, const std::string& key, long default_value) {
+    size_t position = findValue(json, key);
+    if (position == std::string::npos) {
+        return default_value;
+    }
+    char* end = nullptr;
+    long value = std::strtol(json.c_str() + position, &end, 10);
+    return end == json.c_str() + position ? default_value : value;
+}
+
+bool ServiceClient::getBool(const std::string& json, const std::string& key) {
+    size_t position = findValue(json, key);
+    return position != std::string::npos && json.compare(position, 4, "true") == 0;
+}
@@ -0,0 +1,81 @@
+"""
+MCPClient 工具调用的用户隔离。
+
+运行：python -m unittest discover tests
+"""
+import os
+import sys
+import json
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "python"))
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import config
+import mcp_client
+
+
+class FakeSession:
+    """记录工具调用参数的 MCP 会话，工具列表与 order_helper 的参数形式相同"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def list_tools(self):
+        tools = [
+            SimpleNamespace(name="db_search", description="", inputSchema={"properties": {"query": {}}}),
+            SimpleNamespace(name="similarity_calc", description="",
+                            inputSchema={"properties": {"restaurant_name": {}, "user_id": {}}}),
+        ]
+        return SimpleNamespace(tools=tools)
+
+    async def call_tool(self, name, arguments):
+        self.calls.append((name, dict(arguments)))
+        return SimpleNamespace(content=[SimpleNamespace(text="ok")])
+
+
+class ScriptedClient(mcp_client.MCPClient):
+    """第一轮请求调用工具（模型自行填写了其他用户的 user_id），第二轮直接回答"""
+
+    def __init__(self, tool_arguments):
+        super().__init__(llm_client=SimpleNamespace())
+        self.session = FakeSession()
+        self.tool_arguments = tool_arguments
+        self.rounds = 0
+
+    async def create_completion(self, messages, tools, on_token=None):
+        self.rounds += 1
+        if self.rounds > 1:
+            return "stop", mcp_client.ChatCompletionMessage(role="assistant", content="done")
+        tool_calls = [
+            mcp_client.ChatCompletionMessageToolCall(
+                id=f"call_{i}", type="function",
+                function=mcp_client.Function(name=name, arguments=json.dumps(arguments, ensure_ascii=False)))
+            for i, (name, arguments) in enumerate(self.tool_arguments)
+        ]
+        return "tool_calls", mcp_client.ChatCompletionMessage(role="assistant", content=None, tool_calls=tool_calls)
+
+
+class ToolUserIdTest(unittest.TestCase):
+    def run_query(self, user_id):
+        client = ScriptedClient([
+            ("db_search", {"query": "猪肉荣"}),
+            ("similarity_calc", {"restaurant_name": "猪肉荣", "user_id": "mallory"}),
+        ])
+        response = asyncio.run(client.process_query("猪肉荣", user_id=user_id))
+        self.assertEqual(response, "done")
+        return dict(client.session.calls)
+
+    def test_model_supplied_user_id_is_replaced_for_default_user(self):
+        calls = self.run_query(None)
+        self.assertEqual(calls["similarity_calc"]["user_id"], config.DEFAULT_USER_ID)
+
+    def test_model_supplied_user_id_is_replaced_for_named_user(self):
+        calls = self.run_query("alice")
+        self.assertEqual(calls["similarity_calc"]["user_id"], "alice")
+
+
+if __name__ == "__main__":
+    unittest.main()